@@ -0,0 +1,70 @@
+"""
+Benchmark for logging trials with the LogBuffer.
+
+Logs a large number of rows and reports the average cost per row for every block of rows. With amortized O(1)
+appends the per-row cost stays flat no matter how long the session already is.
+
+Usage: python -m benchmarks.bench_log_buffer [number of rows]
+"""
+import sys
+import time
+from datetime import datetime
+
+from log_buffer import LogBuffer
+from pointing_experiment import FittsLawModel
+
+NUM_ROWS = 200000
+NUM_BLOCKS = 10
+
+
+def make_row(i):
+    """ Returns a row with a value for every column of FittsLawModel.CSV_HEADER, like the rows of add_log_row """
+    now_ns = time.perf_counter_ns()
+    values = {
+        'user_id': 1,
+        'timestamp': datetime.now(),
+        'condition': 'Circle',
+        'num_clicks': 1,
+        'time_taken_in_ms': 500 + i % 300,
+        'click_x': i % 1280,
+        'click_y': i % 720,
+        'target_x': i % 1280 + 0.5,
+        'target_y': i % 720 + 0.5,
+        'target_width': 40,
+        'num_shapes': 200,
+        'screen_width': 1280,
+        'screen_height': 720,
+        'helper_enabled': True,
+        'movement_start_ns': now_ns - 500000000,
+        'click_ns': now_ns,
+        'log_ns': now_ns,
+        'helper_latency_mean_us': 35.2,
+        'helper_latency_max_us': 120.4
+    }
+    return {column: values.get(column, i) for column in FittsLawModel.CSV_HEADER}
+
+
+def run(num_rows=NUM_ROWS, num_blocks=NUM_BLOCKS):
+    """ Returns a list of (rows logged so far, average nanoseconds per row in the last block) """
+    log = LogBuffer(FittsLawModel.CSV_HEADER)
+    block_size = max(num_rows // num_blocks, 1)
+    results = []
+    for block in range(num_blocks):
+        rows = [make_row(block * block_size + i) for i in range(block_size)]
+        start = time.perf_counter_ns()
+        for row in rows:
+            log.append(row)
+        results.append((len(log), (time.perf_counter_ns() - start) / block_size))
+
+    return results
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_ROWS
+    print('rows logged,ns per row')
+    for rows, ns_per_row in run(num_rows):
+        print('{},{:.0f}'.format(rows, ns_per_row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""
+Benchmark suite for the hot paths of the pointing experiment.
+
+Every benchmark reports the median and minimum time per call in microseconds. The inputs are generated from fixed
+seeds, so every run measures the same work. The results are written as JSON and compared with a stored baseline; the
+script exits with status 1 if the minimum time of a benchmark (which is far less affected by other processes than the
+median) got slower than the baseline by more than the tolerance, so regressions are caught before running a study.
+The speed of the machine itself can vary within seconds (frequency scaling, other virtual machines on the same host),
+so the timing loops of a benchmark are spread over about a second and the fastest loop counts. A benchmark that still
+looks slower is run again (--retries times) and the fastest run counts. The baseline should be recorded on the lab
+machine with --save-baseline. The results of the benchmark functions that were run replace all their entries in the
+stored baseline, so --filter NAME --save-baseline only records those benchmarks, and entries that a benchmark no
+longer reports are dropped.
+
+The paintEvent and startup benchmarks run under the offscreen Qt platform. The startup benchmarks start a new process
+for every measurement (see benchmarks/startup.py).
+
+Usage: python -m benchmarks.run [--quick] [--filter NAME] [--output results.json] [--baseline baseline.json]
+                                [--save-baseline] [--tolerance 0.25] [--retries 2]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(BENCHMARK_DIR, os.pardir, 'config.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, 'results.json')
+
+# settings for all models created by the benchmarks: no output files, no background threads, the same layouts
+MODEL_SETTINGS = {'logOutput': os.devnull, 'trajectoryOutput': '', 'prefetchLayouts': 0, 'seed': 0}
+
+BENCHMARKS = []
+
+
+def benchmark(function):
+    BENCHMARKS.append(function)
+    return function
+
+
+def measure(function, repeat=11, min_time=0.05, duration=1.0):
+    """
+    Calls function in loops that take at least min_time / 10 seconds and returns the median and minimum time per call
+    in microseconds over at least repeat loops, which are run for at least duration seconds
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - start >= min_time / 10 or number >= 1 << 20:
+            break
+        number *= 2
+
+    timings = []
+    end = time.perf_counter() + duration
+    while len(timings) < repeat or time.perf_counter() < end:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+
+    return {'median_us': statistics.median(timings), 'min_us': min(timings)}
+
+
+def create_model(**settings):
+    from pointing_experiment import FittsLawModel
+
+    return FittsLawModel(CONFIG_FILE, dict(MODEL_SETTINGS, **settings))
+
+
+@benchmark
+def bench_spread(results, quick):
+    import numpy as np
+    from super_spreader import spread
+
+    screen_sizes = [(850, 650), (1280, 720), (1920, 1080)] if not quick else [(1280, 720)]
+    for screen_width, screen_height in screen_sizes:
+        for shape_width, distance in [(40, 50), (20, 25)]:
+            name = 'spread/{}x{}/d{}'.format(screen_width, screen_height, distance)
+            # a new generator with the same seed for every call, so every call spreads the same layout
+            results[name] = measure(lambda: spread(100000, screen_width - shape_width, screen_height - shape_width,
+                                                   shape_width, distance, np.random.default_rng(0)),
+                                    repeat=5 if quick else 11)
+
+
+def create_target_layout(num_targets, rng):
+    """ Returns the shapes of a 1920x1080 layout with num_targets of ~1300 shapes """
+    import numpy as np
+    from layout_library import LAYOUT_DTYPE
+    from super_spreader import poisson_disc
+
+    coords = poisson_disc(1880, 1040, 30, rng=rng)
+    shapes = np.zeros(len(coords), dtype=LAYOUT_DTYPE)
+    shapes['x'] = coords[:, 0]
+    shapes['y'] = coords[:, 1]
+    shapes['is_target'][rng.choice(len(coords), num_targets, replace=False)] = True
+    return shapes
+
+
+@benchmark
+def bench_cursor_helper(results, quick):
+    import numpy as np
+    from pointing_technique import CursorHelper, PointerEvent
+
+    rng = np.random.default_rng(0)
+    events = [PointerEvent(x, y) for x, y in rng.uniform(0, (1920, 1080), (256, 2))]
+    for num_targets in ([1, 10, 100, 1000] if not quick else [1, 1000]):
+        helper = CursorHelper(create_target_layout(num_targets, rng), 20, 30)
+        event_iterator = itertools.cycle(events)
+        results['cursor_helper.filter/{}'.format(num_targets)] = measure(lambda: helper.filter(next(event_iterator)))
+        results['cursor_helper.nearest/{}'.format(num_targets)] = \
+            measure(lambda: helper.get_nearest_target_distance(next(event_iterator)))
+
+
+@benchmark
+def bench_prediction_helper(results, quick):
+    import numpy as np
+    from pointing_technique import PointerEvent, TargetPredictionHelper
+
+    rng = np.random.default_rng(0)
+    # straight movements through the layout, sampled at 1000 Hz
+    events = [PointerEvent(100 + 4 * i, 100 + 2 * i, i) for i in range(400)]
+    for num_targets in ([1, 10, 100, 1000] if not quick else [1, 1000]):
+        helper = TargetPredictionHelper(create_target_layout(num_targets, rng), 20, 30)
+        event_iterator = itertools.cycle(events)
+        name = 'prediction_helper.filter/{}'.format(num_targets)
+        results[name] = measure(lambda: helper.filter(next(event_iterator)))
+
+
+@benchmark
+def bench_area_cursor(results, quick):
+    import numpy as np
+    from nearest_raster import NearestShapeRaster
+
+    rng = np.random.default_rng(0)
+    shapes = create_target_layout(1, rng)
+    results['area_cursor.build/1920x1080'] = measure(lambda: NearestShapeRaster(shapes, 20, 1920, 1080),
+                                                     repeat=3 if quick else 7)
+    raster = NearestShapeRaster(shapes, 20, 1920, 1080)
+    points = itertools.cycle([tuple(pt) for pt in rng.uniform(0, (1920, 1080), (256, 2)).tolist()])
+    results['area_cursor.lookup'] = measure(lambda: raster.lookup(*next(points)))
+
+
+@benchmark
+def bench_handle_click(results, quick):
+    import numpy as np
+    from layout_library import get_target_centers
+
+    model = create_model()
+    rng = np.random.default_rng(0)
+    clicks = itertools.cycle([tuple(pt) for pt in rng.uniform(0, (model.screen_width, model.screen_height), (256, 2))])
+    results['model.handle_click/miss'] = measure(lambda: model.handle_click(*next(clicks)))
+    target = get_target_centers(model.shapes, model.shape_width)[0].tolist()
+    results['model.handle_click/hit'] = measure(lambda: model.handle_click(*target))
+
+
+@benchmark
+def bench_add_log_row(results, quick):
+    from pointing_technique import PointerEvent
+
+    model = create_model()
+    event = PointerEvent(100, 100)
+    logged = 0
+    for session_size in ([1000, 10000, 100000] if not quick else [1000, 10000]):
+        # grow the session to the given size, then measure the cost of logging one more row
+        while logged < session_size:
+            model.add_log_row(1, 500, event)
+            logged += 1
+        # the session grows while measuring, so time blocks of rows instead of calling measure()
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            for _ in range(50):
+                model.add_log_row(1, 500, event)
+            timings.append((time.perf_counter() - start) / 50 * 1e6)
+        logged += 1000
+        results['model.add_log_row/{}'.format(session_size)] = {'median_us': statistics.median(timings),
+                                                                'min_us': min(timings)}
+    model.close_log()
+
+
+@benchmark
+def bench_paint_event(results, quick):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtWidgets
+    from pointing_experiment import ApplicationState, FittsLawExperiment
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    model = create_model()
+    experiment = FittsLawExperiment(model)
+    experiment.application_state = ApplicationState.EXPERIMENT
+    app.processEvents()
+
+    def repaint_new_layout():
+        model.refresh()
+        experiment.repaint()
+
+    results['experiment.paintEvent/cached'] = measure(experiment.repaint)
+    results['experiment.paintEvent/new_layout'] = measure(repaint_new_layout, repeat=3 if quick else 7)
+    experiment.hide()
+    model.layouts.stop()
+
+
+@benchmark
+def bench_startup(results, quick):
+    import subprocess
+
+    for prefetch in ([0, 3] if not quick else [3]):
+        # like measure(), start processes for a few seconds so the fastest one is not from a slow phase of the machine
+        timings = []
+        end = time.perf_counter() + (1 if quick else 4)
+        while len(timings) < (3 if quick else 7) or time.perf_counter() < end:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--prefetch', str(prefetch)],
+                                    cwd=os.path.join(BENCHMARK_DIR, os.pardir), capture_output=True, text=True,
+                                    check=True).stdout
+            timings.append(json.loads(output.splitlines()[-1]))
+        for stage in ('imports', 'first_paint', 'ready'):
+            times = [timing[stage] * 1e6 for timing in timings]
+            results['startup/prefetch{}/{}'.format(prefetch, stage)] = {'median_us': statistics.median(times),
+                                                                        'min_us': min(times)}
+
+
+def run_benchmark(function, quick):
+    """ Runs a benchmark function and returns its results, tagged with the name of the function """
+    print('running', function.__name__, file=sys.stderr)
+    results = {}
+    function(results, quick)
+    for result in results.values():
+        result['benchmark'] = function.__name__
+    return results
+
+
+def compare(results, baseline, tolerance, names=None):
+    """
+    Returns the names of all benchmarks that are slower than the baseline by more than tolerance
+    :param names: only compare these benchmarks
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline or (names is not None and name not in names):
+            continue
+        ratio = result['min_us'] / baseline[name]['min_us']
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<45} {:>12.2f} us {:>7.2f}x{}'.format(name, result['min_us'], ratio, flag), file=sys.stderr)
+
+    return regressions
+
+
+def write_report(report, path):
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmarks of the pointing experiment')
+    parser.add_argument('--quick', action='store_true', help='run fewer parameter combinations')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose function name contains this')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='file the JSON results are written to')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline to compare the results with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results in the baseline, replacing those of the same benchmarks')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before failing, 0.25 = 25 %%')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='how often benchmarks that are slower than the baseline are run again')
+    args = parser.parse_args()
+
+    functions = [function for function in BENCHMARKS if args.filter in function.__name__]
+    results = {}
+    for function in functions:
+        results.update(run_benchmark(function, args.quick))
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+    write_report(report, args.output)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # the entries of the benchmark functions that were run are replaced, including the ones they dropped
+            names = {function.__name__ for function in functions}
+            with open(args.baseline) as file:
+                kept = {name: result for name, result in json.load(file)['results'].items()
+                        if result.get('benchmark') not in names}
+            report['results'] = dict(kept, **results)
+        write_report(report, args.baseline)
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for _ in range(args.retries):
+            if not regressions:
+                break
+            rerun = {results[name]['benchmark'] for name in regressions}
+            for function in functions:
+                if function.__name__ in rerun:
+                    for name, result in run_benchmark(function, args.quick).items():
+                        if result['min_us'] < results[name]['min_us']:
+                            results[name] = result
+            regressions = compare(results, baseline, args.tolerance, regressions)
+            write_report(report, args.output)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
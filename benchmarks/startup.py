@@ -0,0 +1,58 @@
+"""
+Measures the startup of the experiment in a fresh process (offscreen): the time until the experiment modules are
+imported, until the window is painted for the first time and until the experiment is ready to start (the first layout
+is loaded). All times are measured from the start of this script, so they include the imports.
+
+Run with python -m benchmarks.run --filter startup, or on its own: python -m benchmarks.startup [--prefetch N]
+Prints the times in seconds as one line of JSON.
+"""
+import time
+
+START = time.perf_counter()
+
+import argparse  # noqa: E402 (the imports are part of the measurement)
+import json  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+
+TIMEOUT_MS = 30000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of the experiment')
+    parser.add_argument('--prefetch', type=int, default=3, help='number of layouts prepared in the background')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtCore, QtWidgets
+    from benchmarks.run import CONFIG_FILE
+    from pointing_experiment import FittsLawExperiment, FittsLawModel
+
+    timings = {'imports': time.perf_counter() - START}
+
+    class PaintWatcher(QtCore.QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QtCore.QEvent.Paint and 'first_paint' not in timings:
+                timings['first_paint'] = time.perf_counter() - START
+            return False
+
+    def on_ready():
+        timings['ready'] = time.perf_counter() - START
+        app.quit()
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    model = FittsLawModel(CONFIG_FILE, {'logOutput': os.devnull, 'trajectoryOutput': '',
+                                        'prefetchLayouts': args.prefetch}, load_layout=False)
+    experiment = FittsLawExperiment(model)
+    watcher = PaintWatcher()
+    experiment.installEventFilter(watcher)
+    experiment.ready.connect(on_ready)
+    QtCore.QTimer.singleShot(TIMEOUT_MS, app.quit)
+    app.exec_()
+
+    model.layouts.stop()
+    print(json.dumps(timings))
+
+
+if __name__ == '__main__':
+    main()
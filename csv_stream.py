@@ -0,0 +1,164 @@
+"""
+Streaming CSV output for the logged trials.
+
+Every row is written as soon as it is logged, so a crash or a killed process only loses the rows that were not flushed
+yet instead of the whole session. The output is flushed after a configurable number of rows or time interval, and can
+be rotated into several files. Optionally a background thread does the actual writing, so a slow disk or a blocked
+pipe never stalls the Qt event loop. Without it the caller has to call flush_if_due() when get_flush_delay() has
+passed, so the interval is kept even if no further row is written; the experiment widget does this with a QTimer.
+Existing files are never overwritten, so restarting after a crash cannot destroy the rows that were saved.
+"""
+import csv
+import glob
+import os
+import queue
+import sys
+import threading
+import time
+
+STDOUT = 'stdout'
+
+
+class CsvStreamWriter:
+    """
+    :param columns: the names of the columns; the header is written once at the beginning of every file
+    :param output: 'stdout' or the path of the CSV file
+    :param flush_rows: flush after this many rows have been written
+    :param flush_interval: flush at the latest this many seconds after the first unflushed row
+    :param rotate_rows: start a new file after this many rows (0 = never). The rotated files are named like the
+    output file with a running number appended, e.g. log_1.csv, log_2.csv
+    :param background: write in a background thread instead of the calling thread
+    :raises FileExistsError: if the output file (or one of its rotated files) already exists
+    """
+
+    def __init__(self, columns, output=STDOUT, flush_rows=1, flush_interval=1.0, rotate_rows=0, background=False):
+        self.columns = list(columns)
+        self.output = output
+        self.flush_rows = max(flush_rows, 1)
+        self.flush_interval = flush_interval
+        self.rotate_rows = rotate_rows
+        self.file = None
+        self.writer = None
+        self.file_number = 0
+        self.rows_in_file = 0
+        self.unflushed_rows = 0
+        self.first_unflushed_time = 0
+        self.rows_written = 0                       # rows passed to write_row, in background mode some may be queued
+        self.check_output()
+
+        self.queue = None
+        self.worker = None
+        if background:
+            self.queue = queue.SimpleQueue()
+            self.worker = threading.Thread(target=self.write_queued_rows, name='csv-writer', daemon=True)
+            self.worker.start()
+
+    def write_row(self, row):
+        """ Writes a row given as a dictionary of column name -> value """
+        values = [row.get(column) for column in self.columns]
+        self.rows_written += 1
+        if self.queue is not None:
+            self.queue.put(values)
+        else:
+            self.write_values(values)
+
+    def close(self):
+        """ Writes all pending rows, flushes and closes the output. Stdout is flushed but not closed """
+        if self.worker is not None:
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
+
+        if self.file is None:
+            self.open_file()        # an empty session still gets a header
+        self.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+        self.file = None
+
+    def write_queued_rows(self):
+        while True:
+            try:
+                timeout = None
+                if self.unflushed_rows:
+                    timeout = max(self.first_unflushed_time + self.flush_interval - time.monotonic(), 0)
+                values = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush()
+                continue
+
+            if values is None:
+                return
+            self.write_values(values)
+
+    def write_values(self, values):
+        if self.file is None or (self.rotate_rows and self.rows_in_file >= self.rotate_rows):
+            self.open_file()
+
+        self.writer.writerow(values)
+        self.rows_in_file += 1
+        if not self.unflushed_rows:
+            self.first_unflushed_time = time.monotonic()
+        self.unflushed_rows += 1
+
+        if self.unflushed_rows >= self.flush_rows \
+                or time.monotonic() - self.first_unflushed_time >= self.flush_interval:
+            self.flush()
+
+    def get_flush_delay(self):
+        """
+        Returns the seconds until the written rows are due to be flushed, or None if no rows are waiting. In background
+        mode the worker flushes by itself, so the caller never has to
+        """
+        if self.worker is not None or not self.unflushed_rows:
+            return None
+        return max(self.first_unflushed_time + self.flush_interval - time.monotonic(), 0)
+
+    def flush_if_due(self):
+        """ Flushes if the flush interval has passed since the first unflushed row was written """
+        delay = self.get_flush_delay()
+        if delay is not None and delay <= 0:
+            self.flush()
+
+    def check_output(self):
+        """ Fails before the first row if an earlier session (e.g. one that crashed) left its log at the output path """
+        if self.output == STDOUT:
+            return
+        paths = [self.output]
+        if self.rotate_rows:
+            root, extension = os.path.splitext(self.output)
+            paths += glob.glob(glob.escape(root) + '_[0-9]*' + glob.escape(extension))
+        # devices and pipes (e.g. /dev/null) are written to as before
+        existing = [path for path in paths if os.path.isfile(path)]
+        if existing:
+            raise FileExistsError('the log file {} already exists, move it or choose another logOutput'
+                                  .format(existing[0]))
+
+    def open_file(self):
+        if self.output == STDOUT:
+            if self.file is None:
+                self.file = sys.stdout
+                self.writer = csv.writer(self.file, lineterminator='\n')
+                self.writer.writerow(self.columns)
+            self.rows_in_file = 0
+            return
+
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+
+        path = self.output
+        if self.file_number:
+            root, extension = os.path.splitext(self.output)
+            path = '{}_{}{}'.format(root, self.file_number, extension)
+        self.file_number += 1
+
+        self.file = open(path, 'w' if os.path.exists(path) and not os.path.isfile(path) else 'x', newline='')
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        self.writer.writerow(self.columns)
+        self.rows_in_file = 0
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+        self.unflushed_rows = 0
@@ -0,0 +1,231 @@
+"""
+Fitts' law analysis of the session logs of the pointing experiment.
+
+Reads any number of session CSVs (FittsLawModel.CSV_HEADER, older logs with only the original columns work as well)
+and computes per trial the target distance, movement distance and index of difficulty, and per participant and condition
+the effective width, effective index of difficulty, throughput, error rate and the regression MT = a + b * ID. All
+measures are computed with vectorized pandas/NumPy operations on whole columns or groups.
+
+Every trial starts at the center of the window. The index of difficulty uses the distance between the center and the
+target, the movement distance is the distance between the center and the click. The effective width is 4.133 times the
+standard deviation of the click position along the movement axis (start -> target center) relative to the target center
+over all trials of a participant in the same condition and target distance bin (ISO 9241-9, like live_stats.py).
+Older logs without the target position fall back to the click position as target, so their spread is unknown and the
+nominal target width is used as effective width.
+
+Parsed session files are cached in a columnar format (Feather if pyarrow is installed, otherwise pickle) keyed by the
+path, size and modification time of the CSV, so repeated analyses only parse new or changed files.
+
+Usage: python fitts_analysis.py <session.csv or glob> [...] [--cache-dir DIR] [--no-cache] [--bin-width PX]
+"""
+import argparse
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# the columns of the session CSVs used by the analysis
+SESSION_COLUMNS = ['user_id', 'condition', 'num_clicks', 'time_taken_in_ms', 'click_x', 'click_y', 'target_x',
+                   'target_y', 'target_width', 'screen_width', 'screen_height', 'helper_enabled']
+GROUP_COLUMNS = ['user_id', 'condition']
+
+EFFECTIVE_WIDTH_FACTOR = 4.133
+DEFAULT_BIN_WIDTH = 100                             # width of the target distance bins for the effective width in px
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.analysis_cache')
+CACHE_VERSION = 2                                   # increase when the cached per-trial columns change
+
+try:
+    import pyarrow  # noqa: F401 (only needed by DataFrame.to_feather / read_feather)
+    CACHE_EXTENSION = '.feather'
+except ImportError:
+    CACHE_EXTENSION = '.pkl'
+
+
+def expand_paths(patterns):
+    """ Returns the sorted CSV paths matching the given file names or glob patterns """
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern)
+        paths.update(matches if matches else [pattern])
+    return sorted(paths)
+
+
+def read_session(path):
+    """ Reads a session CSV and adds the per-trial measures """
+    trials = pd.read_csv(path, usecols=lambda column: column in SESSION_COLUMNS)
+    # trials in which the cursor never left the start position have no movement time
+    trials = trials.dropna(subset=['time_taken_in_ms']).reset_index(drop=True)
+    trials['session'] = os.path.basename(path)
+    return add_trial_measures(trials)
+
+
+def add_trial_measures(trials):
+    """
+    Adds the target distance, the movement distance, the deviation of the click along the movement axis, the index of
+    difficulty and the number of errors of every trial
+    """
+    start_x = (trials['screen_width'] / 2).astype(int)
+    start_y = (trials['screen_height'] / 2).astype(int)
+    if 'target_x' not in trials:
+        trials['target_x'] = np.nan
+        trials['target_y'] = np.nan
+    # older logs have no target position, the click (which hit the target) is the best estimate of the target distance
+    target_dx = trials['target_x'].fillna(trials['click_x']) - start_x
+    target_dy = trials['target_y'].fillna(trials['click_y']) - start_y
+    trials['target_distance'] = np.hypot(target_dx, target_dy)
+    trials['distance'] = np.hypot(trials['click_x'] - start_x, trials['click_y'] - start_y)
+    # NaN without target position or if the target is at the start position (no movement axis)
+    trials['deviation'] = ((trials['click_x'] - trials['target_x']) * target_dx
+                           + (trials['click_y'] - trials['target_y']) * target_dy) \
+        / trials['target_distance'].where(trials['target_distance'] > 0)
+    trials['index_of_difficulty'] = np.log2(trials['target_distance'] / trials['target_width'] + 1)
+    trials['errors'] = trials['num_clicks'] - 1
+    trials['movement_time_s'] = trials['time_taken_in_ms'] / 1000
+    return trials
+
+
+def get_cache_path(path, cache_dir):
+    stat = os.stat(path)
+    key = '{}:{}:{}:{}'.format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, CACHE_VERSION)
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + CACHE_EXTENSION)
+
+
+def load_session(path, cache_dir=DEFAULT_CACHE_DIR):
+    """ Like read_session, but uses the cached result if the file has not changed. cache_dir=None disables caching """
+    if cache_dir is None:
+        return read_session(path)
+
+    cache_path = get_cache_path(path, cache_dir)
+    if os.path.exists(cache_path):
+        return read_trials(cache_path)
+
+    trials = read_session(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_trials(trials, cache_path)
+    return trials
+
+
+def read_trials(path):
+    """ Reads a DataFrame of trials written by write_trials, in the format given by the extension of the path """
+    return pd.read_feather(path) if os.path.splitext(path)[1] == '.feather' else pd.read_pickle(path)
+
+
+def write_trials(trials, path):
+    """ Writes a DataFrame of trials as Feather if the path ends with .feather, otherwise as pickle """
+    if os.path.splitext(path)[1] == '.feather':
+        trials.reset_index(drop=True).to_feather(path)
+    else:
+        trials.to_pickle(path)
+
+
+def load_sessions(patterns, cache_dir=DEFAULT_CACHE_DIR):
+    """ Loads all session CSVs matching the given file names or glob patterns into one DataFrame of trials """
+    sessions = [load_session(path, cache_dir) for path in expand_paths(patterns)]
+    if not sessions:
+        raise ValueError('no session files found')
+    return pd.concat(sessions, ignore_index=True)
+
+
+def effective_measures(trials, bin_width=DEFAULT_BIN_WIDTH):
+    """
+    Computes the effective measures per participant, condition and target distance bin.
+    Bins with less than two trials have no spread and are dropped.
+    :return: DataFrame with the columns trials, movement_time_s, distance, We, IDe and throughput
+    """
+    distance_bin = (trials['target_distance'] // bin_width).astype(int).rename('distance_bin')
+    grouped = trials.groupby(GROUP_COLUMNS + [distance_bin])
+    bins = grouped.agg(trials=('distance', 'size'), movement_time_s=('movement_time_s', 'mean'),
+                       distance=('distance', 'mean'), deviation_sd=('deviation', 'std'),
+                       target_width=('target_width', 'mean'))
+    bins = bins[bins['trials'] > 1].copy()
+
+    # the nominal width if the spread is unknown (older logs without target position)
+    bins['We'] = (EFFECTIVE_WIDTH_FACTOR * bins['deviation_sd']).fillna(bins['target_width'])
+    bins = bins[bins['We'] > 0]
+    bins['IDe'] = np.log2(bins['distance'] / bins['We'] + 1)
+    bins['throughput'] = bins['IDe'] / bins['movement_time_s']
+    return bins.drop(columns=['deviation_sd', 'target_width'])
+
+
+def throughput(trials, bin_width=DEFAULT_BIN_WIDTH):
+    """
+    Throughput in bits/s as the mean of means: first per participant and condition over the distance bins, then per
+    condition over the participants
+    """
+    per_participant = effective_measures(trials, bin_width).groupby(GROUP_COLUMNS)['throughput'].mean()
+    return per_participant.groupby('condition').agg(['mean', 'std', 'count']) \
+        .rename(columns={'count': 'participants'})
+
+
+def error_rates(trials, by=('condition',)):
+    """ Error rate = missed clicks / all clicks """
+    sums = trials.groupby(list(by))[['errors', 'num_clicks']].sum()
+    sums['error_rate'] = sums['errors'] / sums['num_clicks']
+    return sums
+
+
+def regression_sums(trials, x='index_of_difficulty', y='time_taken_in_ms', by=('condition',)):
+    """
+    Group sums n, x, y, x^2, y^2 and xy from which the regression is computed. Sums of disjoint sets of trials can be
+    added up, so they can be computed per session and merged later
+    """
+    values = pd.DataFrame({'n': 1, 'x': trials[x], 'y': trials[y], 'xx': trials[x] ** 2, 'yy': trials[y] ** 2,
+                           'xy': trials[x] * trials[y]})
+    for column in by:
+        values[column] = trials[column]
+    return values.groupby(list(by)).sum()
+
+
+def fit_regressions(sums):
+    """
+    Least squares fit y = intercept + slope * x for every row of group sums (see regression_sums)
+    :return: DataFrame with the columns trials, intercept, slope and r2
+    """
+    n = sums['n']
+    sxx = sums['xx'] - sums['x'] ** 2 / n
+    syy = sums['yy'] - sums['y'] ** 2 / n
+    sxy = sums['xy'] - sums['x'] * sums['y'] / n
+    slope = sxy / sxx
+    return pd.DataFrame({
+        'trials': n,
+        'intercept': (sums['y'] - slope * sums['x']) / n,
+        'slope': slope,
+        'r2': sxy ** 2 / (sxx * syy)
+    })
+
+
+def regressions(trials, x='index_of_difficulty', y='time_taken_in_ms', by=('condition',)):
+    """ Least squares fit y = intercept + slope * x per group """
+    return fit_regressions(regression_sums(trials, x, y, by))
+
+
+def analyse(trials, bin_width=DEFAULT_BIN_WIDTH):
+    """ Returns all summary tables of the trials as a dictionary of DataFrames """
+    return {
+        'movement_time': trials.groupby('condition')['time_taken_in_ms'].agg(['mean', 'std', 'min', 'max', 'count']),
+        'throughput': throughput(trials, bin_width),
+        'error_rates': error_rates(trials),
+        'regressions': regressions(trials)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fitts' law analysis of pointing experiment sessions")
+    parser.add_argument('sessions', nargs='+', help='session CSV files or glob patterns')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='directory of the parsed session cache')
+    parser.add_argument('--no-cache', action='store_true', help='always parse the CSV files')
+    parser.add_argument('--bin-width', type=float, default=DEFAULT_BIN_WIDTH,
+                        help='width of the target distance bins')
+    args = parser.parse_args()
+
+    trials = load_sessions(args.sessions, None if args.no_cache else args.cache_dir)
+    for name, table in analyse(trials, args.bin_width).items():
+        print('#', name)
+        print(table.to_string())
+        print()
+
+
+if __name__ == '__main__':
+    main()
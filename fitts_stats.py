@@ -0,0 +1,191 @@
+"""
+Bootstrap confidence intervals and permutation tests for the differences between conditions.
+
+Compares the movement time, the error rate and the throughput of every pair of conditions (by default condition and
+helper_enabled, so the standard and helper sessions of the old logs are told apart as well). Every metric is a ratio of
+two sums over the trials, e.g. error rate = missed clicks / all clicks, so the metric of a resample only needs the sums
+over the resampled trials:
+
+* bootstrap: the trials of each condition are resampled with replacement. The percentile interval of the resampled
+  differences is the confidence interval of the difference
+* permutation test: the trials of both conditions are pooled and randomly split into two groups of the original sizes.
+  The p-value (two-sided) is the share of splits with a difference at least as large as the observed one
+
+The resamples are drawn as index matrices (one row per resample) and evaluated with vectorized NumPy. They are
+processed in chunks of a bounded number of indexes, so the memory does not grow with the number of resamples. With
+several workers the chunks are distributed over a process pool. Every chunk has its own seed derived from the main seed,
+so the results do not depend on the number of workers.
+
+The throughput is the mean of the per-trial throughput ID / MT. The effective throughput of fitts_analysis.py needs
+several trials per distance bin, which the resamples of small sessions often do not have.
+
+Usage: python fitts_stats.py <session.csv or glob> [...] [--by COLUMN ...] [--resamples N] [--workers N] [--seed S]
+"""
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import fitts_analysis
+
+# metric -> (numerator column, denominator column or None for the number of trials)
+METRICS = {
+    'movement_time_ms': ('time_taken_in_ms', None),
+    'error_rate': ('errors', 'num_clicks'),
+    'throughput': ('throughput', None)
+}
+DEFAULT_BY = ['condition', 'helper_enabled']
+DEFAULT_RESAMPLES = 10000
+CHUNK_INDEXES = 1 << 20                             # maximum number of trial indexes per chunk of resamples
+
+
+def prepare_trials(trials, by=DEFAULT_BY):
+    """ Adds the per-trial throughput and the column 'group' (the values of the by columns) to the trials """
+    trials = trials[trials['movement_time_s'] > 0].copy()
+    trials['throughput'] = trials['index_of_difficulty'] / trials['movement_time_s']
+    trials['group'] = trials[list(by)].astype(str).agg('/'.join, axis=1)
+    return trials
+
+
+def get_values(trials, metric):
+    """ Returns the numerator and denominator of the metric per trial as two arrays """
+    numerator, denominator = METRICS[metric]
+    values = trials[numerator].to_numpy(dtype=np.float64)
+    weights = trials[denominator].to_numpy(dtype=np.float64) if denominator else np.ones(len(values))
+    return values, weights
+
+
+def get_chunks(resamples, trials_per_resample, chunk_indexes=CHUNK_INDEXES):
+    """ Returns the number of resamples of every chunk """
+    chunk_size = max(chunk_indexes // max(trials_per_resample, 1), 1)
+    return [min(chunk_size, resamples - start) for start in range(0, resamples, chunk_size)]
+
+
+def bootstrap_chunk(values_a, weights_a, values_b, weights_b, resamples, seed):
+    """ Returns the differences (a - b) of the metric for the given number of bootstrap resamples """
+    rng = np.random.default_rng(seed)
+    indexes_a = rng.integers(0, len(values_a), (resamples, len(values_a)))
+    indexes_b = rng.integers(0, len(values_b), (resamples, len(values_b)))
+    metric_a = values_a[indexes_a].sum(axis=1) / weights_a[indexes_a].sum(axis=1)
+    metric_b = values_b[indexes_b].sum(axis=1) / weights_b[indexes_b].sum(axis=1)
+    return metric_a - metric_b
+
+
+def permutation_chunk(values, weights, size_a, observed, resamples, seed):
+    """
+    Returns how many of the given number of random splits of the pooled trials into groups of size_a and the rest have
+    an absolute difference of at least the observed one
+    """
+    rng = np.random.default_rng(seed)
+    indexes = rng.permuted(np.broadcast_to(np.arange(len(values)), (resamples, len(values))), axis=1)[:, :size_a]
+    # the sums of group b are the total sums minus the sums of group a
+    values_a = values[indexes].sum(axis=1)
+    weights_a = weights[indexes].sum(axis=1)
+    differences = values_a / weights_a - (values.sum() - values_a) / (weights.sum() - weights_a)
+    # a small tolerance, so splits with the same difference as observed are not lost to rounding errors
+    return int((np.abs(differences) >= abs(observed) * (1 - 1e-9)).sum())
+
+
+def get_seed_sequence(seed):
+    """ :param seed: None, an int or a numpy.random.SeedSequence """
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+def run_chunks(function, arguments, chunks, seed, executor=None):
+    """ Runs function(*arguments, resamples, seed) for every chunk, with independent seeds derived from seed """
+    seeds = get_seed_sequence(seed).spawn(len(chunks))
+    if executor is None:
+        return [function(*arguments, resamples, chunk_seed) for resamples, chunk_seed in zip(chunks, seeds)]
+    futures = [executor.submit(function, *arguments, resamples, chunk_seed)
+               for resamples, chunk_seed in zip(chunks, seeds)]
+    return [future.result() for future in futures]
+
+
+def compare(trials_a, trials_b, metric, resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=None, executor=None):
+    """
+    Compares a metric between two sets of trials.
+    :param executor: optional concurrent.futures executor the chunks of resamples are run on
+    :return: dictionary with the metric of both sets, their difference (a - b), its bootstrap confidence interval and
+    the p-value of the permutation test
+    """
+    values_a, weights_a = get_values(trials_a, metric)
+    values_b, weights_b = get_values(trials_b, metric)
+    value_a = values_a.sum() / weights_a.sum()
+    value_b = values_b.sum() / weights_b.sum()
+    observed = value_a - value_b
+    bootstrap_seed, permutation_seed = get_seed_sequence(seed).spawn(2)
+
+    chunks = get_chunks(resamples, len(values_a) + len(values_b))
+    differences = np.concatenate(run_chunks(bootstrap_chunk, (values_a, weights_a, values_b, weights_b), chunks,
+                                            bootstrap_seed, executor))
+    alpha = (1 - confidence) / 2
+    ci_low, ci_high = np.quantile(differences, [alpha, 1 - alpha])
+
+    values = np.concatenate([values_a, values_b])
+    weights = np.concatenate([weights_a, weights_b])
+    extreme = sum(run_chunks(permutation_chunk, (values, weights, len(values_a), observed), chunks, permutation_seed,
+                             executor))
+    return {
+        'metric': metric,
+        'trials_a': len(values_a),
+        'trials_b': len(values_b),
+        'value_a': value_a,
+        'value_b': value_b,
+        'difference': observed,
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+        'p_value': (extreme + 1) / (resamples + 1)
+    }
+
+
+def compare_groups(trials, by=DEFAULT_BY, metrics=tuple(METRICS), resamples=DEFAULT_RESAMPLES, confidence=0.95,
+                   seed=None, workers=1):
+    """
+    Compares every pair of groups (see prepare_trials) in every metric.
+    :param workers: number of worker processes, 1 runs everything in this process
+    :return: DataFrame with one row per pair of groups and metric
+    """
+    trials = prepare_trials(trials, by)
+    groups = {name: group for name, group in trials.groupby('group')}
+    pairs = list(itertools.combinations(sorted(groups), 2))
+    seeds = get_seed_sequence(seed).spawn(len(pairs) * len(metrics))
+
+    executor = None
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(workers)
+    try:
+        rows = []
+        for (a, b), metric in itertools.product(pairs, metrics):
+            row = {'a': a, 'b': b}
+            row.update(compare(groups[a], groups[b], metric, resamples, confidence, seeds[len(rows)], executor))
+            rows.append(row)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bootstrap confidence intervals and permutation tests for the '
+                                                 'differences between the conditions of pointing experiment sessions')
+    parser.add_argument('sessions', nargs='+', help='session CSV files or glob patterns')
+    parser.add_argument('--by', nargs='+', default=DEFAULT_BY, help='columns that define the compared groups')
+    parser.add_argument('--metrics', nargs='+', default=list(METRICS), choices=list(METRICS))
+    parser.add_argument('--resamples', type=int, default=DEFAULT_RESAMPLES, help='number of resamples per test')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generator')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--cache-dir', default=fitts_analysis.DEFAULT_CACHE_DIR,
+                        help='directory of the parsed session cache')
+    parser.add_argument('--no-cache', action='store_true', help='always parse the CSV files')
+    args = parser.parse_args()
+
+    trials = fitts_analysis.load_sessions(args.sessions, None if args.no_cache else args.cache_dir)
+    results = compare_groups(trials, args.by, args.metrics, args.resamples, args.confidence, args.seed, args.workers)
+    print(results.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Runs the pointing helper as a separate stage of the event pipeline.
+
+Mouse move events only hand their position to the pipeline. A QTimer with a fixed rate takes the most recent position
+once per tick (older positions that arrived in the meantime are coalesced), runs the helper on it once and moves the
+cursor if the helper returns a correction. QCursor.setPos produces a move event of its own; this self-generated event
+is recognized by its position and not fed to the helper again, so a correction can not trigger a chain of further
+corrections.
+"""
+import collections
+import time
+
+from PyQt5 import QtCore, QtGui
+
+from pointing_technique import PointerEvent
+from profiler import profiled
+
+PendingMove = collections.namedtuple('PendingMove', ['x', 'y', 'timestamp_ms', 'event_ns'])
+
+
+class HelperPipeline(QtCore.QObject):
+    """
+    :param widget: the widget the cursor is moved in
+    :param model: the FittsLawModel, provides the helper and records the latency of the corrections
+    :param rate_hz: number of ticks per second
+    :param tick_budget_ms: maximum time a tick should take. If a tick takes longer, the following ticks are skipped
+    until the time is made up, so a slow helper can not starve the event loop
+    """
+
+    def __init__(self, widget, model, rate_hz=250, tick_budget_ms=2.0):
+        super().__init__(widget)
+        self.widget = widget
+        self.model = model
+        self.interval_ms = max(int(round(1000 / rate_hz)), 1)
+        self.tick_budget_ns = int(tick_budget_ms * 1e6)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.setInterval(self.interval_ms)
+        self.timer.timeout.connect(self.tick)
+
+        self.pending = None                         # the most recent move event that was not processed yet
+        self.expected_position = None               # where the last correction moved the cursor to
+        self.skip_ticks = 0
+        self.ticks = 0
+        self.corrections = 0
+        self.coalesced_events = 0                   # move events that were replaced by a newer one before a tick
+        self.self_generated_events = 0              # move events caused by the corrections
+        self.budget_overruns = 0
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def reset(self):
+        """ Drops the pending move, e.g. when the layout changed """
+        self.pending = None
+        self.expected_position = None
+
+    def push(self, mouse_event, event_ns):
+        """
+        Hands a move event to the pipeline.
+        :param event_ns: clock_ns() at the arrival of the event, for the latency of the correction
+        :return: True if the event was caused by the last correction of the helper (and is ignored)
+        """
+        position = (mouse_event.x(), mouse_event.y())
+        if position == self.expected_position:
+            self.expected_position = None
+            self.self_generated_events += 1
+            return True
+
+        if self.pending is not None:
+            self.coalesced_events += 1
+        self.pending = PendingMove(position[0], position[1], mouse_event.timestamp(), event_ns)
+        return False
+
+    @profiled('helper_tick')
+    def tick(self):
+        if self.skip_ticks:
+            self.skip_ticks -= 1
+            return
+        if self.pending is None:
+            return
+
+        start = time.perf_counter_ns()
+        move = self.pending
+        self.pending = None
+        self.ticks += 1
+        if not self.model.helper_enabled:
+            return
+
+        new_coords = self.model.helper.filter(PointerEvent(move.x, move.y, move.timestamp_ms))
+        # a pull of less than a pixel is truncated to the current position: nothing to correct, and setPos would not
+        # cause a move event that clears expected_position
+        if new_coords is not None and (new_coords.x(), new_coords.y()) != (move.x, move.y):
+            self.corrections += 1
+            self.expected_position = (new_coords.x(), new_coords.y())
+            QtGui.QCursor.setPos(self.widget.mapToGlobal(new_coords))
+            self.model.record_helper_latency(time.perf_counter_ns() - move.event_ns)
+
+        duration = time.perf_counter_ns() - start
+        if duration > self.tick_budget_ns:
+            self.budget_overruns += 1
+            self.skip_ticks = int(duration // (self.interval_ms * 1000000))
+
+    def stats(self):
+        return {
+            'rate_hz': round(1000 / self.interval_ms, 1),
+            'ticks': self.ticks,
+            'corrections': self.corrections,
+            'coalesced_events': self.coalesced_events,
+            'self_generated_events': self.self_generated_events,
+            'budget_overruns': self.budget_overruns
+        }
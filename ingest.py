@@ -0,0 +1,187 @@
+"""
+Incremental batch ingestion of session logs.
+
+Every session CSV is fingerprinted by size, modification time and SHA-256 hash. The store directory keeps, per
+session, the parsed trials (in the cache format of fitts_analysis) and small per-session aggregates (trials, clicks,
+errors and regression sums per participant and condition), described by a JSON manifest. On every run only new or
+changed sessions are parsed, in a process pool; the aggregates of all other sessions are reused from the manifest.
+The combined dataset is kept as one part per session (the stored trials), so a change only writes the parts of the
+changed sessions. Files whose modification time changed but whose content did not (e.g. after copying) are recognized
+by their hash and not parsed again. Sessions whose files no longer exist are dropped from the store; with --prune also
+the sessions that are not matched by the given files or patterns.
+
+Usage: python ingest.py <session.csv or glob> [...] [--store DIR] [--workers N] [--prune]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import fitts_analysis
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ingest_store')
+MANIFEST_NAME = 'manifest.json'
+AGGREGATE_COLUMNS = ['user_id', 'condition']
+
+
+def hash_file(path, chunk_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def aggregate(trials):
+    """ Per participant and condition sums of a session, which can be added up over sessions """
+    sums = fitts_analysis.regression_sums(trials, by=AGGREGATE_COLUMNS)
+    sums[['errors', 'num_clicks']] = trials.groupby(AGGREGATE_COLUMNS)[['errors', 'num_clicks']].sum()
+    return sums.reset_index()
+
+
+def ingest_file(path, sha256, trials_path):
+    """ Parses a session in a worker process, stores its trials and returns the manifest entry """
+    trials = fitts_analysis.read_session(path)
+    fitts_analysis.write_trials(trials, trials_path)
+    entry = get_stat(path)
+    entry.update({'sha256': sha256, 'trials_file': os.path.basename(trials_path),
+                  'aggregates': aggregate(trials).to_dict('records')})
+    return entry
+
+
+class SessionStore:
+    """
+    :param directory: the directory the manifest and the per-session trials are stored in
+    """
+
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.sessions = {}                          # absolute path of the CSV -> manifest entry
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as file:
+                manifest = json.load(file)
+            # sessions parsed by another version of the analysis lack columns or have outdated measures
+            if manifest.get('version') == fitts_analysis.CACHE_VERSION:
+                self.sessions = manifest['sessions']
+
+    def get_trials_path(self, path, sha256):
+        # files with the same name and content in different directories get different parts
+        path_hash = hashlib.sha1(path.encode()).hexdigest()[:8]
+        name = '{}_{}_{}{}'.format(os.path.splitext(os.path.basename(path))[0], path_hash, sha256[:16],
+                                   fitts_analysis.CACHE_EXTENSION)
+        return os.path.join(self.directory, name)
+
+    def find_changes(self, paths):
+        """
+        Compares the files with the manifest.
+        :return: dictionary path -> hash of all new or changed files, and the number of unchanged files
+        """
+        changed = {}
+        unchanged = 0
+        for path in paths:
+            stat = get_stat(path)
+            entry = self.sessions.get(path)
+            if entry is not None and entry['size'] == stat['size'] and entry['mtime_ns'] == stat['mtime_ns']:
+                unchanged += 1
+                continue
+
+            sha256 = hash_file(path)
+            if entry is not None and entry['sha256'] == sha256:
+                # only touched: keep the parsed session, remember the new modification time
+                entry.update(stat)
+                unchanged += 1
+            else:
+                changed[path] = sha256
+
+        return changed, unchanged
+
+    def ingest(self, patterns, workers=None, prune=False):
+        """
+        Brings the store up to date with the session files matching the given file names or glob patterns.
+        :param workers: number of worker processes, defaults to the number of CPUs
+        :param prune: also remove the stored sessions that are not matched by the patterns, not only the ones whose
+        files no longer exist
+        :return: dictionary with the number of parsed, unchanged and removed sessions
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        paths = [os.path.abspath(path) for path in fitts_analysis.expand_paths(patterns)]
+        changed, unchanged = self.find_changes(paths)
+
+        matched = set(paths)
+        removed = [path for path in self.sessions
+                   if not os.path.exists(path) or (prune and path not in matched)]
+        for path in removed + list(changed):
+            self.remove_session(path)
+
+        if changed:
+            with ProcessPoolExecutor(min(workers or os.cpu_count(), len(changed))) as executor:
+                futures = {path: executor.submit(ingest_file, path, sha256, self.get_trials_path(path, sha256))
+                           for path, sha256 in changed.items()}
+                for path, future in futures.items():
+                    self.sessions[path] = future.result()
+
+        self.write_manifest()
+        return {'parsed': len(changed), 'unchanged': unchanged, 'removed': len(removed)}
+
+    def remove_session(self, path):
+        entry = self.sessions.pop(path, None)
+        if entry is not None:
+            trials_path = os.path.join(self.directory, entry['trials_file'])
+            if os.path.exists(trials_path):
+                os.remove(trials_path)
+
+    def write_manifest(self):
+        with open(self.manifest_path, 'w') as file:
+            json.dump({'version': fitts_analysis.CACHE_VERSION, 'sessions': self.sessions}, file, indent=1)
+
+    def parts(self):
+        """ Returns the paths of the parts of the combined dataset, the stored trials of every session """
+        return [os.path.join(self.directory, entry['trials_file']) for _, entry in sorted(self.sessions.items())]
+
+    def trials(self):
+        """ Returns all trials of all sessions as one DataFrame, or None if the store is empty """
+        sessions = [fitts_analysis.read_trials(path) for path in self.parts()]
+        return pd.concat(sessions, ignore_index=True) if sessions else None
+
+    def aggregates(self):
+        """ Returns the aggregates of all sessions, summed per participant and condition """
+        rows = [row for entry in self.sessions.values() for row in entry['aggregates']]
+        return pd.DataFrame(rows).groupby(AGGREGATE_COLUMNS).sum()
+
+
+def summarize(aggregates):
+    """ Per condition error rates and regressions, computed from the summed aggregates of SessionStore.aggregates """
+    sums = aggregates.groupby('condition').sum()
+    summary = fitts_analysis.fit_regressions(sums)
+    summary['mean_time_in_ms'] = sums['y'] / sums['n']
+    summary['error_rate'] = sums['errors'] / sums['num_clicks']
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally ingest session logs of the pointing experiment')
+    parser.add_argument('sessions', nargs='+', help='session CSV files or glob patterns')
+    parser.add_argument('--store', default=DEFAULT_STORE_DIR, help='directory of the session store')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--prune', action='store_true',
+                        help='remove the stored sessions that are not matched by the given files or patterns')
+    args = parser.parse_args()
+
+    store = SessionStore(args.store)
+    print(json.dumps(store.ingest(args.sessions, args.workers, args.prune)), file=sys.stderr)
+    if store.sessions:
+        print(summarize(store.aggregates()).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Estimates how many shapes fit on the screen.
+
+Poisson disc sampling fills the screen until no more shape fits, so the number of shapes of a layout is limited by the
+screen size, the shape width and the distance between the shapes, no matter how many shapes are requested. This tool
+generates layouts for a grid of these parameters on a process pool and stores the number of shapes that were achieved
+(minimum, mean, standard deviation and maximum over several layouts) and the generation time in a JSON lookup table.
+FittsLawModel clamps the requested number of shapes to the capacity, a number that practically every layout reaches
+(mean - 3 standard deviations, at most the minimum), which is passed to the sampler as the number of points after
+which it stops. So the config can not ask for more shapes than a layout can hold, and every layout
+has exactly the same number of shapes.
+
+Usage: python layout_capacity.py [--output layout_capacity.json] [--samples N] [--workers N]
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+SCREEN_SIZES = [(850, 650), (1280, 720), (1366, 768), (1440, 900), (1920, 1080), (2560, 1440)]
+SHAPE_WIDTHS = [20, 30, 40, 50, 60]
+DISTANCE_FACTORS = [1.0, 1.25, 1.5, 2.0, 3.0]      # distance between the shapes in multiples of the shape width
+TEXT_AREA_HEIGHT = 50                              # see FittsLawModel.TEXT_AREA_HEIGHT, to estimate the usable area
+UNLIMITED_SHAPES = 1 << 30
+CAPACITY_SDS = 3                                   # the capacity is this many standard deviations below the mean
+
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layout_capacity.json')
+CAPACITY_KEYS = ['screen_width', 'screen_height', 'shape_width', 'distance_between_shapes']
+
+
+def measure_capacity(params, samples):
+    """ Generates samples full layouts and returns the table entry for params """
+    import numpy as np
+    from layout_library import generate_layout
+
+    rng = np.random.default_rng()
+    counts = []
+    start = time.perf_counter()
+    for _ in range(samples):
+        counts.append(len(generate_layout(dict(params, num_shapes=UNLIMITED_SHAPES, num_targets=1), rng)))
+    entry = {key: params[key] for key in CAPACITY_KEYS}
+    mean = sum(counts) / len(counts)
+    sd = (sum((count - mean) ** 2 for count in counts) / max(len(counts) - 1, 1)) ** 0.5
+    entry.update({'min_shapes': min(counts), 'mean_shapes': mean, 'sd_shapes': sd, 'max_shapes': max(counts),
+                  'capacity': min(min(counts), int(mean - CAPACITY_SDS * sd)),
+                  'seconds_per_layout': (time.perf_counter() - start) / samples})
+    return entry
+
+
+def get_usable_area(screen_width, screen_height, shape_width, text_area_height=TEXT_AREA_HEIGHT):
+    return max(screen_width - shape_width, 0) * max(screen_height - shape_width - text_area_height, 0)
+
+
+class CapacityTable:
+    """
+    :param entries: list of table entries, see measure_capacity
+    """
+
+    def __init__(self, entries):
+        self.entries = {tuple(entry[key] for key in CAPACITY_KEYS): entry for entry in entries}
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE):
+        with open(path) as file:
+            return cls(json.load(file)['entries'])
+
+    def get_capacity(self, screen_width, screen_height, shape_width, distance_between_shapes):
+        """
+        Returns the number of shapes that fit into every layout with the given parameters, or None if the table is
+        empty. Parameters that are not in the table are estimated from the most similar entry: the number of shapes of a
+        poisson disc layout is proportional to the area divided by the squared distance between the shapes
+        """
+        key = (screen_width, screen_height, shape_width, distance_between_shapes)
+        if key in self.entries:
+            return self.entries[key]['capacity']
+        if not self.entries or distance_between_shapes <= 0:
+            return None
+
+        factor = distance_between_shapes / max(shape_width, 1)
+        area = get_usable_area(screen_width, screen_height, shape_width)
+        nearest = min(self.entries.values(), key=lambda entry: (
+            abs(entry['distance_between_shapes'] / entry['shape_width'] - factor),
+            abs(get_usable_area(entry['screen_width'], entry['screen_height'], entry['shape_width']) - area)))
+        nearest_area = get_usable_area(nearest['screen_width'], nearest['screen_height'], nearest['shape_width'])
+        density = nearest['capacity'] * nearest['distance_between_shapes'] ** 2 / max(nearest_area, 1)
+        return int(density * area / distance_between_shapes ** 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how many shapes fit into the layouts of the experiment')
+    parser.add_argument('--output', default=DEFAULT_TABLE, help='the JSON lookup table')
+    parser.add_argument('--samples', type=int, default=20, help='number of layouts per parameter combination')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    from concurrent.futures import ProcessPoolExecutor
+    from pointing_experiment import FittsLawModel
+
+    grid = [{'screen_width': screen_width, 'screen_height': screen_height, 'shape_width': shape_width,
+             'distance_between_shapes': int(round(shape_width * factor)),
+             'reserved_rects': FittsLawModel.get_reserved_rects(screen_width)}
+            for (screen_width, screen_height), shape_width, factor
+            in itertools.product(SCREEN_SIZES, SHAPE_WIDTHS, DISTANCE_FACTORS)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as executor:
+        entries = list(executor.map(measure_capacity, grid, itertools.repeat(args.samples), chunksize=4))
+
+    with open(args.output, 'w') as file:
+        json.dump({'samples': args.samples, 'entries': entries}, file, indent=1)
+    print('measured {} parameter combinations in {:.1f} s'.format(len(entries), time.perf_counter() - start),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
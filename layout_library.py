@@ -0,0 +1,115 @@
+"""
+Library of precomputed layouts.
+
+All shapes of all layouts are stored in a single .npy file as one flat structured array (x, y, is_target), the layouts
+one after the other. A JSON index next to it holds the offset of every layout in that array, the layout parameters and
+the seed the library was generated with. The array is opened as a memory map, so loading the library is instant and
+getting a layout is a zero-copy slice. Since the library is generated from a seed, every participant can be shown
+exactly the same stimuli.
+
+Usage: python layout_library.py <config.json> <library.npy> [--layouts N] [--seed S]
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from super_spreader import spread
+
+LAYOUT_DTYPE = np.dtype([('x', np.float32), ('y', np.float32), ('is_target', np.bool_)])
+
+
+def get_index_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+def get_target_centers(shapes, shape_width):
+    """ Returns the centers of the targets of a layout as an array of shape (number of targets, 2) """
+    targets = shapes[shapes['is_target']]
+    return np.column_stack([targets['x'], targets['y']]).astype(np.float64) + shape_width / 2
+
+
+def generate_layout(params, rng):
+    """
+    Creates a random layout.
+    :param params: dictionary of layout parameters, see FittsLawModel.get_layout_params
+    :param rng: a numpy.random.Generator
+    :return: structured array of LAYOUT_DTYPE with the top-left corners of all shapes
+    """
+    # no shapes are placed on the ui elements
+    coords = np.array(spread(params['num_shapes'], params['screen_width'] - params['shape_width'],
+                             params['screen_height'] - params['shape_width'], params['shape_width'],
+                             params['distance_between_shapes'], rng, params['reserved_rects']),
+                      dtype=np.float64).reshape(-1, 2)
+
+    layout = np.zeros(len(coords), dtype=LAYOUT_DTYPE)
+    layout['x'] = coords[:, 0]
+    layout['y'] = coords[:, 1]
+    layout['is_target'][rng.choice(len(coords), min(params['num_targets'], len(coords)), replace=False)] = True
+    return layout
+
+
+def generate_library(path, params, num_layouts, seed=None):
+    """ Generates num_layouts layouts and saves them as a library at path (.npy) """
+    seed = seed if seed is not None else int(np.random.SeedSequence().entropy % (1 << 63))
+    rng = np.random.default_rng(seed)
+    layouts = [generate_layout(params, rng) for _ in range(num_layouts)]
+    offsets = np.cumsum([0] + [len(layout) for layout in layouts]).tolist()
+
+    np.save(path, np.concatenate(layouts))
+    with open(get_index_path(path), 'w') as file:
+        json.dump({'params': params, 'seed': seed, 'offsets': offsets}, file, indent=1)
+
+
+class LayoutLibrary:
+    """
+    :param path: path of the .npy file of the library, the index is expected next to it (same name, .json)
+    """
+
+    def __init__(self, path):
+        with open(get_index_path(path)) as file:
+            index = json.load(file)
+        self.params = index['params']
+        self.seed = index['seed']
+        self.offsets = index['offsets']
+        self.shapes = np.load(path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, i):
+        """ Returns the shapes of layout i as a (read-only) view into the memory map """
+        return self.shapes[self.offsets[i]:self.offsets[i + 1]]
+
+    def check_params(self, params):
+        """ Raises a ValueError if the library was generated with different layout parameters """
+        mismatches = ['{}: {} (library) != {} (config)'.format(key, self.params.get(key), value)
+                      for key, value in sorted(params.items()) if self.params.get(key) != value]
+        if mismatches:
+            raise ValueError('the layout library does not match the config: ' + ', '.join(mismatches))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a library of layouts for the pointing experiment')
+    parser.add_argument('config', help='the config file of the experiment')
+    parser.add_argument('output', help='the .npy file of the library, the index is written next to it')
+    parser.add_argument('--layouts', type=int, default=None,
+                        help='number of layouts, defaults to the number of trials of one participant')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generator')
+    args = parser.parse_args()
+
+    from pointing_experiment import FittsLawModel
+
+    # the model without background threads and output only serves to read the config like the experiment does
+    model = FittsLawModel(args.config, {'logOutput': os.devnull, 'trajectoryOutput': '', 'prefetchLayouts': 0,
+                                        'layoutLibrary': ''})
+    model.layouts.stop()
+    num_layouts = args.layouts or model.max_repetitions * len(model.latin_square)
+    generate_library(args.output, model.get_layout_params(), num_layouts, args.seed)
+    print('generated {} layouts'.format(num_layouts), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Prepares the layouts of the upcoming trials in the background.
+
+Generating a layout (spreading the shapes, picking the targets and setting up the pointing helper) takes a noticeable
+amount of time. A worker thread keeps a bounded queue of ready-made layouts filled while the participant is working on
+the current trial, so that switching to the next layout is just taking the first element out of the queue.
+"""
+import collections
+import queue
+import threading
+
+Layout = collections.namedtuple('Layout', ['shapes', 'index', 'helpers', 'raster'])
+
+
+class LayoutPrefetcher:
+    """
+    Bounded queue of layouts that is filled by a background thread.
+
+    :param create_layout: function without arguments that returns a new Layout
+    :param size: maximum number of layouts that are prepared in advance. With a size of 0 no thread is started and
+    every layout is created on demand
+    """
+
+    # how long (in seconds) the worker waits on a full queue before checking whether it should stop
+    STOP_POLL_INTERVAL = 0.1
+
+    def __init__(self, create_layout, size):
+        self.create_layout = create_layout
+        self.size = size
+        # holds the prepared layouts, or the exception create_layout raised in the worker, which get() raises again
+        self.queue = queue.Queue(maxsize=size)
+        self.stopped = threading.Event()
+        self.worker = None
+        self.served = 0                             # number of layouts handed out
+        self.misses = 0                             # number of times a layout was requested while the queue was empty
+
+    def start(self):
+        if self.size > 0 and self.worker is None:
+            self.worker = threading.Thread(target=self.fill_queue, name='layout-prefetcher', daemon=True)
+            self.worker.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+
+    def fill_queue(self):
+        while not self.stopped.is_set():
+            try:
+                layout = self.create_layout()
+            except Exception as error:
+                # the worker stops, get() raises the error in the thread that is waiting for the layout
+                layout = error
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(layout, timeout=self.STOP_POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(layout, Exception):
+                return
+
+    def ready(self):
+        """
+        True if a prepared layout (or the error of the worker) is waiting in the queue, so get() will not block
+        """
+        return self.queue.qsize() > 0
+
+    def get(self):
+        """
+        Returns the next layout. If the worker could not keep up, this blocks until it has finished the layout it is
+        currently working on (instead of generating a second one in parallel), so layouts are handed out in order.
+        Raises the exception of create_layout if the worker failed.
+        """
+        self.served += 1
+        if self.worker is None:
+            self.misses += 1
+            return self.create_layout()
+
+        try:
+            layout = self.queue.get_nowait()
+        except queue.Empty:
+            self.misses += 1
+            layout = self.queue.get()
+        if isinstance(layout, Exception):
+            # put back, so every further get() (and ready()) fails as well instead of waiting for the stopped worker
+            self.queue.put_nowait(layout)
+            raise layout
+        return layout
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.size,
+            'layouts_served': self.served,
+            'queue_empty': self.misses,
+            'queue_empty_rate': self.misses / self.served if self.served else 0.0
+        }
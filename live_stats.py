@@ -0,0 +1,173 @@
+"""
+Fitts' law statistics that are updated with every logged trial, so the quality of a session can be checked while it is
+running instead of afterwards with fitts_analysis.py.
+
+Per condition the running mean and variance of the movement time and of the click error (the distance between click
+and target center) are updated with Welford's algorithm, and the regression MT = a + b * ID is fitted online from the
+running co-moments of ID and MT. Every update takes constant time and memory, no matter how long the session is.
+The throughput follows ISO 9241-9: the effective width is 4.133 times the standard deviation of the click positions
+along the movement axis, the effective distance is the mean distance between start position and click.
+The statistics are available through LiveStats.snapshot() and are optionally written to a JSON file periodically.
+"""
+import json
+import math
+import os
+import time
+
+EFFECTIVE_WIDTH_FACTOR = 4.133                      # see fitts_analysis.EFFECTIVE_WIDTH_FACTOR
+
+
+class RunningStats:
+    """ Running mean and variance (Welford) """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0                               # sum of the squared differences from the mean
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else None
+
+    def sd(self):
+        variance = self.variance()
+        return math.sqrt(variance) if variance is not None else None
+
+    def to_dict(self):
+        return {'mean': self.mean if self.n else None, 'sd': self.sd()}
+
+
+class RunningRegression:
+    """ Online least squares fit y = intercept + slope * x from the running means and co-moments of x and y """
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.sxx = 0.0
+        self.syy = 0.0
+        self.sxy = 0.0
+
+    def add(self, x, y):
+        self.n += 1
+        delta_x = x - self.mean_x
+        delta_y = y - self.mean_y
+        self.mean_x += delta_x / self.n
+        self.mean_y += delta_y / self.n
+        self.sxx += delta_x * (x - self.mean_x)
+        self.syy += delta_y * (y - self.mean_y)
+        self.sxy += delta_x * (y - self.mean_y)
+
+    def slope(self):
+        return self.sxy / self.sxx if self.sxx > 0 else None
+
+    def intercept(self):
+        slope = self.slope()
+        return self.mean_y - slope * self.mean_x if slope is not None else None
+
+    def r2(self):
+        return self.sxy ** 2 / (self.sxx * self.syy) if self.sxx > 0 and self.syy > 0 else None
+
+    def to_dict(self):
+        return {'intercept': self.intercept(), 'slope': self.slope(), 'r2': self.r2()}
+
+
+class ConditionStats:
+    def __init__(self):
+        self.trials = 0
+        self.clicks = 0
+        self.errors = 0                             # missed clicks
+        self.movement_time = RunningStats()         # in ms
+        self.click_error = RunningStats()           # distance between click and target center in px
+        self.deviation = RunningStats()             # click position along the movement axis relative to the target
+        self.distance = RunningStats()              # distance between start position and click
+        self.regression = RunningRegression()       # movement time in ms over the index of difficulty
+
+    def add_trial(self, movement_time_ms, start, target, click, width, clicks):
+        self.trials += 1
+        self.clicks += clicks
+        self.errors += clicks - 1
+        self.movement_time.add(movement_time_ms)
+
+        target_dx = target[0] - start[0]
+        target_dy = target[1] - start[1]
+        target_distance = math.hypot(target_dx, target_dy)
+        click_dx = click[0] - target[0]
+        click_dy = click[1] - target[1]
+        self.click_error.add(math.hypot(click_dx, click_dy))
+        self.distance.add(math.hypot(click[0] - start[0], click[1] - start[1]))
+        if target_distance > 0:
+            self.deviation.add((click_dx * target_dx + click_dy * target_dy) / target_distance)
+        self.regression.add(math.log2(target_distance / width + 1), movement_time_ms)
+
+    def throughput(self):
+        """ Effective index of difficulty in bits and throughput in bits/s, None while there are too few trials """
+        sd = self.deviation.sd()
+        if not sd or self.movement_time.mean <= 0:
+            return None, None
+        effective_id = math.log2(self.distance.mean / (EFFECTIVE_WIDTH_FACTOR * sd) + 1)
+        return effective_id, effective_id / (self.movement_time.mean / 1000)
+
+    def to_dict(self):
+        effective_id, throughput = self.throughput()
+        return {
+            'trials': self.trials,
+            'error_rate': self.errors / self.clicks if self.clicks else None,
+            'movement_time_ms': self.movement_time.to_dict(),
+            'click_error_px': self.click_error.to_dict(),
+            'regression': self.regression.to_dict(),
+            'effective_id': effective_id,
+            'throughput': throughput
+        }
+
+
+class LiveStats:
+    """
+    :param output: JSON file the snapshot is written to ('' = only available through snapshot())
+    :param interval: write the snapshot at most every this many seconds
+    """
+
+    def __init__(self, output='', interval=5.0):
+        self.output = output
+        self.interval = interval
+        self.conditions = {}
+        self.last_write = None
+
+    def add_trial(self, condition, movement_time_ms, start, target, click, width, clicks=1):
+        """
+        Adds a successful trial and writes the snapshot if the interval has passed.
+        :param condition: name of the condition
+        :param start: the start position (x, y) of the movement
+        :param target: the center (x, y) of the target that was hit
+        :param click: the position (x, y) of the click that hit the target
+        :param width: the width of the target
+        :param clicks: the number of clicks of the trial including the missed ones
+        """
+        if condition not in self.conditions:
+            self.conditions[condition] = ConditionStats()
+        self.conditions[condition].add_trial(movement_time_ms, start, target, click, width, clicks)
+
+        if self.output and (self.last_write is None or time.monotonic() - self.last_write >= self.interval):
+            self.write_snapshot()
+
+    def snapshot(self):
+        """ Returns the current statistics per condition as a dictionary """
+        return {'updated': time.time(),
+                'conditions': {name: stats.to_dict() for name, stats in sorted(self.conditions.items())}}
+
+    def write_snapshot(self):
+        # written to a temporary file first, so readers never see a partially written snapshot
+        temporary_path = self.output + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.snapshot(), file, indent=1)
+        os.replace(temporary_path, self.output)
+        self.last_write = time.monotonic()
+
+    def close(self):
+        if self.output and self.conditions:
+            self.write_snapshot()
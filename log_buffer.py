@@ -0,0 +1,44 @@
+"""
+Columnar in-memory store for the logged trials.
+
+Every column is a plain list, so appending a row is amortized O(1) (unlike DataFrame.append, which copied the whole
+frame for every row). A pandas DataFrame or a CSV file is only built when it is actually requested.
+"""
+import csv
+
+
+class LogBuffer:
+    """
+    :param columns: the names of the columns, in the order they are written to the CSV output
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.data = {column: [] for column in self.columns}
+
+    def __len__(self):
+        return len(self.data[self.columns[0]]) if self.columns else 0
+
+    def append(self, row):
+        """ Appends a row given as a dictionary of column name -> value. Missing columns are logged as None """
+        for column in self.columns:
+            self.data[column].append(row.get(column))
+
+    def rows(self, start=0):
+        """ Iterates over the logged rows (as tuples in column order), beginning with the row at index start """
+        return zip(*(self.data[column][start:] for column in self.columns))
+
+    def clear(self):
+        for values in self.data.values():
+            values.clear()
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(self.data, columns=self.columns)
+
+    def to_csv(self, file):
+        """ Writes the header and all rows to a file object as CSV (without an index column) """
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(self.columns)
+        writer.writerows(self.rows())
@@ -0,0 +1,85 @@
+"""
+Lookup raster of the nearest shape for every point of the screen, used by the area cursor.
+
+The screen is divided into square cells of CELL_SIZE pixels. Every cell holds the index of the shape whose center is
+nearest to the center of the cell, so the raster is a downsampled Voronoi diagram of the shape centers, and finding the
+shape nearest to the cursor is a single array lookup.
+
+The raster is built once per layout with vectorized NumPy. The cells are grouped into square blocks. If the nearest
+shape to the center of a block is r away, the nearest shape to any point of the block is at most r + 2h away from the
+block center (h = half the diagonal of the block), so only the shapes within that radius are candidates. The distances
+between all cells and the candidates of their block are then computed at once, for several blocks per chunk so the
+memory stays bounded.
+"""
+import numpy as np
+
+
+class NearestShapeRaster:
+    """
+    :param shapes: the shapes of the layout, see layout_library.LAYOUT_DTYPE
+    :param shape_width: the width of the shapes
+    :param width: width of the area covered by the raster (the widget)
+    :param height: height of the area covered by the raster
+    :param cell_size: width of the cells in pixels, the resolution of the raster
+    """
+
+    CELL_SIZE = 4
+    BLOCK_CELLS = 16                                # width of the blocks in cells
+    CHUNK_ELEMENTS = 1 << 16                        # cell-candidate distances per chunk, small enough to stay in cache
+
+    def __init__(self, shapes, shape_width, width, height, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.rows = max(-(-int(height) // cell_size), 1)
+        self.columns = max(-(-int(width) // cell_size), 1)
+        centers = np.column_stack([shapes['x'], shapes['y']]).astype(np.float64) + shape_width / 2
+        self.labels = self.build(centers)
+
+    def build(self, centers):
+        """ Returns the raster as an array of shape (rows, columns) with the index of the nearest shape, -1 if none """
+        if not len(centers):
+            return np.full((self.rows, self.columns), -1, dtype=np.int32)
+
+        block_size = self.BLOCK_CELLS * self.cell_size
+        block_rows = -(-self.rows // self.BLOCK_CELLS)
+        block_columns = -(-self.columns // self.BLOCK_CELLS)
+        block_y, block_x = np.divmod(np.arange(block_rows * block_columns), block_columns)
+        block_centers = np.column_stack([block_x, block_y]) * block_size + block_size / 2
+
+        # the candidates of every block are its k nearest shapes, with k the largest number of shapes within the radius
+        # of any block. Additional candidates do not change the result
+        delta_x = block_centers[:, None, 0] - centers[None, :, 0]
+        delta_y = block_centers[:, None, 1] - centers[None, :, 1]
+        squared_distances = delta_x * delta_x + delta_y * delta_y
+        radius = np.sqrt(squared_distances.min(axis=1)) + block_size * np.sqrt(2)
+        num_candidates = int((squared_distances <= (radius ** 2)[:, None]).sum(axis=1).max())
+        if num_candidates < len(centers):
+            candidates = np.argpartition(squared_distances, num_candidates - 1, axis=1)[:, :num_candidates]
+        else:
+            candidates = np.broadcast_to(np.arange(len(centers)), squared_distances.shape)
+
+        # centers of the cells of a block, relative to the top-left corner of the block
+        offset_y, offset_x = np.divmod(np.arange(self.BLOCK_CELLS ** 2), self.BLOCK_CELLS)
+        cell_offsets = (np.column_stack([offset_x, offset_y]) + 0.5) * self.cell_size
+
+        labels = np.empty((len(block_centers), self.BLOCK_CELLS ** 2), dtype=np.int32)
+        chunk_blocks = max(self.CHUNK_ELEMENTS // (self.BLOCK_CELLS ** 2 * num_candidates), 1)
+        for start in range(0, len(block_centers), chunk_blocks):
+            chunk = slice(start, start + chunk_blocks)
+            cells = (block_centers[chunk] - block_size / 2)[:, None, :] + cell_offsets[None, :, :]
+            candidate_centers = centers[candidates[chunk]]
+            delta_x = cells[:, :, None, 0] - candidate_centers[:, None, :, 0]
+            delta_y = cells[:, :, None, 1] - candidate_centers[:, None, :, 1]
+            nearest = (delta_x * delta_x + delta_y * delta_y).argmin(axis=2)
+            labels[chunk] = np.take_along_axis(candidates[chunk], nearest, axis=1)
+
+        # blocks x cells of a block -> rows x columns of the screen
+        labels = labels.reshape(block_rows, block_columns, self.BLOCK_CELLS, self.BLOCK_CELLS)
+        labels = labels.transpose(0, 2, 1, 3).reshape(block_rows * self.BLOCK_CELLS, block_columns * self.BLOCK_CELLS)
+        return np.ascontiguousarray(labels[:self.rows, :self.columns])
+
+    def lookup(self, x, y):
+        """ Returns the index of the shape nearest to the point (x, y), or None if there are no shapes """
+        row = min(max(int(y) // self.cell_size, 0), self.rows - 1)
+        column = min(max(int(x) // self.cell_size, 0), self.columns - 1)
+        label = int(self.labels[row, column])
+        return label if label >= 0 else None
@@ -1,15 +1,23 @@
+import itertools
 import random
 import sys
 import json
-import math
+import os
+import time
 
 from PyQt5 import QtWidgets
-from super_spreader import spread
 from enum import Enum
-from PyQt5 import Qt, QtCore, QtGui
+from PyQt5 import QtCore, QtGui
 from datetime import datetime
-import pandas as pd
-from pointing_technique import CursorHelper
+from pointing_technique import CursorHelper, TargetPredictionHelper
+from layout_prefetcher import Layout, LayoutPrefetcher
+from layout_capacity import DEFAULT_TABLE, CapacityTable
+from spatial_index import SpatialIndex
+from csv_stream import CsvStreamWriter, STDOUT
+from profiler import get_profile_output, profiled, profiler
+from helper_pipeline import HelperPipeline
+from live_stats import LiveStats
+from session_recorder import MOVE, PRESS, SessionRecorder
 
 
 LATIN_SQUARE_FULL = [[1, 3, 4, 2],
@@ -20,8 +28,27 @@ LATIN_SQUARE_FULL = [[1, 3, 4, 2],
 LATIN_SQUARE_SINGLE = [[1, 2],
                        [2, 1]]
 
+LATIN_SQUARE_PREDICTION = [[1, 5, 6, 2],
+                           [6, 1, 2, 5],
+                           [2, 6, 5, 1],
+                           [5, 2, 1, 6]]
+
+LATIN_SQUARE_AREA = [[1, 7, 8, 2],
+                     [8, 1, 2, 7],
+                     [2, 8, 7, 1],
+                     [7, 2, 1, 8]]
+
 TEST_TYPE_FULL = "full"
 TEST_TYPE_SINGLE = "single"
+TEST_TYPE_PREDICTION = "prediction"
+TEST_TYPE_AREA = "area"
+
+TECHNIQUE_GRAVITY = "gravity"
+TECHNIQUE_PREDICTION = "prediction"
+
+
+# monotonic clock with nanosecond resolution used for all timings, independent of changes of the wall clock
+clock_ns = time.perf_counter_ns
 
 
 class ApplicationState(Enum):
@@ -35,63 +62,113 @@ class Condition(Enum):
     Square = 2
     CircleHelper = 3
     SquareHelper = 4
+    CirclePrediction = 5
+    SquarePrediction = 6
+    CircleArea = 7
+    SquareArea = 8
 
 
-class MyShape:
-    def __init__(self, model, center, is_target):
-        self.model = model
-        self.is_target = is_target
-        self.center = center
-        self.x_coord = center[0]
-        self.y_coord = center[1]
-
-    def set_is_target(self, is_target):
-        self.is_target = is_target
+CIRCLE_CONDITIONS = (Condition.Circle, Condition.CircleHelper, Condition.CirclePrediction, Condition.CircleArea)
+HELPER_CONDITIONS = (Condition.CircleHelper, Condition.SquareHelper)
+PREDICTION_CONDITIONS = (Condition.CirclePrediction, Condition.SquarePrediction)
+AREA_CONDITIONS = (Condition.CircleArea, Condition.SquareArea)
 
 
 class FittsLawModel:
     CSV_HEADER = ['user_id', 'timestamp', 'condition', 'num_clicks', 'time_taken_in_ms', 'click_x', 'click_y',
-                  'target_width', 'num_shapes', 'screen_width', 'screen_height', 'helper_enabled']
+                  'target_x', 'target_y', 'target_width', 'num_shapes', 'screen_width', 'screen_height',
+                  'helper_enabled', 'movement_start_ns', 'click_ns', 'log_ns', 'helper_latency_mean_us',
+                  'helper_latency_max_us']
     MIN_SCREEN_WIDTH = 850
     MIN_SCREEN_HEIGHT = 650
+    TEXT_AREA_HEIGHT = 50                           # height of the ui text area at the top
 
     user_id = 0                                     # current participant id
     shape_width = 0                                 # width of the shapes on screen
     num_shapes = 0                                  # maximum number of shapes on screen
+    requested_num_shapes = 0                        # number of shapes in the config, before clamping to the capacity
     helper_enabled = False                          # toggle for the pointing helper
     num_targets = 0                                 # number of valid clickable targets
     screen_width = 0                                # width of the widget
     screen_height = 0                               # height of the widget
-    shape_coords = []                               # list of tuples containing the x and y coordinates of all shapes
-    shapes = []                                     # list containing the shape objects (see class 'MyShape')
-    target_coords = []                              # list of tuples containing the x and y coordinates of target shapes
     max_repetitions = 0                             # repetitions per condition
     distance_between_shapes = 0                     # minimum distance in pixels between the shapes
-    test_type = ""                                  # either "full" or "single", determines the conditions
+    test_type = ""                                  # "full", "single", "prediction" or "area" (see set_helper)
     helper_gravity_distance = 0                     # distance threshold for magnetic pointer helper activation
-
-    def __init__(self):
+    helper_technique = TECHNIQUE_GRAVITY            # pointing technique of test type "single"
+    helper_rate_hz = 250                            # how often per second the pointing helper corrects the cursor
+    helper_tick_budget_ms = 2.0                     # maximum time a correction of the pointing helper should take
+    prefetch_layouts = 0                            # number of layouts that are prepared in the background
+    log_output = "stdout"                           # where the CSV log is streamed to, "stdout" or a file path
+    log_flush_rows = 1                              # flush the CSV output after this many rows
+    log_flush_interval = 1.0                        # flush the CSV output at the latest after this many seconds
+    log_rotate_rows = 0                             # start a new CSV file after this many rows (0 = never)
+    log_background_writer = False                   # write the CSV output in a background thread
+    trajectory_output = ""                          # .npy file the pointer trajectories are saved to ("" = disabled)
+    profile_output = ""                             # JSON file the event handler profile is saved to ("" = disabled)
+    layout_library = ""                             # .npy file of a precomputed layout library ("" = random layouts)
+    seed = None                                     # seed of the random layouts (None = different every time)
+    session_recording = ""                          # JSON lines file the input events are recorded to ("" = disabled)
+    settings = {}                                   # the experiment settings as read from the config file
+    live_stats_output = ""                          # JSON file the live statistics are written to ("" = disabled)
+    live_stats_interval = 5.0                       # write the live statistics at most every this many seconds
+
+    def __init__(self, config_file=None, settings=None, load_layout=True):
+        """
+        :param config_file: path of the config file, defaults to the first command line argument
+        :param settings: optional dictionary of settings (same keys as in config.json) overriding the config file
+        :param load_layout: if False, the first layout is not loaded yet, so the model is created without delay. It is
+        prepared by warm_up() (which also starts preparing layouts in the background) and loaded by ensure_layout()
+        """
+        self.shapes = None                          # the shapes of the current layout, see layout_library.LAYOUT_DTYPE
+        self.layout_number = 0                      # increased whenever the shapes are replaced by a new layout
         self.helper = ()
-        self.parse_setup(sys.argv[1])
-        self.init_shapes()
-        self.init_shape_coords()
-        self.timer = QtCore.QTime()
+        self.helpers = {}                           # the pointing techniques of the current layout, by name
+        self.technique = TECHNIQUE_GRAVITY          # name of the pointing technique of the current condition
+        self.area_cursor = False                    # True if a click selects the nearest shape (area conditions)
+        self.index = None
+        self.raster = None                          # nearest shape lookup of the current layout, for the area cursor
+        self.last_click = None                      # the shape hit by the last click (see spatial_index.HitResult)
+        self.parse_setup(config_file or sys.argv[1], settings)
+        self.rng = None                             # random generator of the layouts, see start_layouts
+        self.library = None
+        if self.layout_library:
+            from layout_library import LayoutLibrary
+            self.library = LayoutLibrary(self.layout_library)
+            self.library.check_params(self.get_layout_params())
+        self.library_positions = itertools.count()  # the layouts of the library are shown in order
+        self.layouts = LayoutPrefetcher(self.create_layout, self.prefetch_layouts)
         self.mouse_moving = False
+        self.movement_start_ns = None               # clock_ns() when the cursor left the start position
+        self.click_ns = None                        # clock_ns() of the click that hit the target
+        self.click_time = None                      # wall clock time of that click, for the 'timestamp' column
+        self.helper_latency_count = 0               # number of helper corrections in the current trial
+        self.helper_latency_sum_ns = 0
+        self.helper_latency_max_ns = 0
         self.current_participant_repetitions = 1    # counts how many conditions the participant has already completed
-        self.latin_square = LATIN_SQUARE_FULL if self.test_type == TEST_TYPE_FULL else LATIN_SQUARE_SINGLE
+        self.latin_square = {TEST_TYPE_FULL: LATIN_SQUARE_FULL,
+                             TEST_TYPE_PREDICTION: LATIN_SQUARE_PREDICTION,
+                             TEST_TYPE_AREA: LATIN_SQUARE_AREA}.get(self.test_type, LATIN_SQUARE_SINGLE)
         self.current_latin_square_row = self.calculate_row_for_id()
         self.current_condition_index = 0
         self.current_condition = self.latin_square[self.current_latin_square_row][self.current_condition_index]
         self.set_helper()
-        self.df = pd.DataFrame(columns=self.CSV_HEADER)
-
-    def parse_setup(self, filename):
+        self.log_writer = CsvStreamWriter(self.CSV_HEADER, self.log_output, self.log_flush_rows,
+                                          self.log_flush_interval, self.log_rotate_rows, self.log_background_writer)
+        self.trajectory = None                      # created by warm_up() if trajectories are recorded
+        self.live_stats = LiveStats(self.live_stats_output, self.live_stats_interval)
+        if load_layout:
+            self.warm_up()
+            self.ensure_layout()
+
+    def parse_setup(self, filename, settings=None):
         """
         Read config from config.json
         See config.json for comments on the settings
         """
         with open(filename) as file:
             data = json.load(file)['experiment']
+            data.update(settings or {})
 
             self.user_id = data['userId']
             self.shape_width = data['shapeWidth']
@@ -106,6 +183,50 @@ class FittsLawModel:
             self.distance_between_shapes = data['distanceBetweenShapes']
             self.test_type = data['testType']
             self.helper_gravity_distance = data['helperGravityDistance']
+            self.helper_technique = data.get('helperTechnique', TECHNIQUE_GRAVITY)
+            self.helper_rate_hz = data.get('helperRateHz', 250)
+            self.helper_tick_budget_ms = data.get('helperTickBudgetMs', 2.0)
+            self.prefetch_layouts = data.get('prefetchLayouts', 3)
+            self.log_output = data.get('logOutput', 'stdout')
+            self.log_flush_rows = data.get('logFlushRows', 1)
+            self.log_flush_interval = data.get('logFlushInterval', 1.0)
+            self.log_rotate_rows = data.get('logRotateRows', 0)
+            self.log_background_writer = data.get('logBackgroundWriter', False)
+            self.trajectory_output = data.get('trajectoryOutput')
+            if self.trajectory_output is None:
+                # by default the trajectories are saved next to the CSV file (not possible when logging to stdout)
+                self.trajectory_output = \
+                    '' if self.log_output == STDOUT else os.path.splitext(self.log_output)[0] + '_trajectories.npy'
+            self.profile_output = get_profile_output(data.get('profileOutput', ''))
+            self.layout_library = data.get('layoutLibrary', '')
+            self.seed = data.get('seed')
+            self.session_recording = data.get('sessionRecording', '')
+            if self.session_recording and self.seed is None:
+                # a recorded session can only be replayed with the same layouts
+                self.seed = data['seed'] = random.getrandbits(63)
+            self.settings = data
+            self.live_stats_output = data.get('liveStatsOutput', '')
+            self.live_stats_interval = data.get('liveStatsInterval', 5.0)
+            self.requested_num_shapes = self.num_shapes
+            self.num_shapes = self.clamp_num_shapes(data.get('layoutCapacityTable', DEFAULT_TABLE))
+
+    def clamp_num_shapes(self, capacity_table):
+        """
+        Limits the number of shapes to the number that fits on the screen according to the capacity table (see
+        layout_capacity.py), so the sampler stops once that many shapes are placed and every layout has the same
+        number of shapes
+        """
+        if not capacity_table or not os.path.exists(capacity_table):
+            return self.num_shapes
+
+        capacity = CapacityTable.load(capacity_table).get_capacity(self.screen_width, self.screen_height,
+                                                                   self.shape_width, self.distance_between_shapes)
+        if capacity is None or capacity >= self.num_shapes:
+            return self.num_shapes
+
+        print('numberShapes: only about {} of {} shapes fit on the screen'.format(capacity, self.num_shapes),
+              file=sys.stderr)
+        return capacity
 
     def calculate_row_for_id(self):
         """
@@ -120,39 +241,97 @@ class FittsLawModel:
             normalized_id = self.user_id - to_subtract * len(self.latin_square)
             return normalized_id - 1
 
-    def init_shapes(self):
-        self.init_shape_coords()
-        self.init_shape_list()
-        self.helper = CursorHelper(self.target_coords, self.shape_width, self.helper_gravity_distance)
+    def start_layouts(self):
+        """
+        Creates the random generator of the layouts and starts preparing layouts in the background. The generator is
+        created here in the calling thread, as create_layout runs in the worker thread and must not modify the model
+        """
+        if self.library is None and self.rng is None:
+            import numpy as np
+            self.rng = np.random.default_rng(self.seed)
+        self.layouts.start()
 
-    def init_shape_coords(self):
-        self.shape_coords = spread(self.num_shapes, self.screen_width - self.shape_width,
-                                   self.screen_height - self.shape_width, self.shape_width,
-                                   self.distance_between_shapes)
-        self.remove_shapes_from_text_area()
+    def init_shapes(self):
+        self.set_layout(self.layouts.get())
 
-    def init_shape_list(self):
+    def warm_up(self):
         """
-        Initializes the list of shapes
-        Then sets a defined number of shapes as valid target.
-        The targets are chosen randomly and the operation may time out if the script is unable to find enough
-        valid shapes (this means that less targets than specified will be set)
+        Does the expensive part of the setup that is not needed to show a window: creates the trajectory buffers, starts
+        preparing layouts in the background and, if layouts are not prefetched, creates the first layout. The window
+        calls this after its first paint, so the worker thread does not compete with showing the window
         """
-        for center in self.shape_coords:
-            self.shapes.append(MyShape(self, center, False))
-
-        for x in range(self.num_targets):
-            unique_timeout = 0
-            shape = random.choice(self.shapes)
-            while shape.is_target:                      # try to randomly find a shape that is not yet set as target
-                unique_timeout += 1
-                shape = random.choice(self.shapes)
-                if unique_timeout > 1000:               # stop randomly picking shapes after a certain amount of tries
-                    break
-
-            shape.set_is_target(True)
-            self.target_coords\
-                .append((shape.center[0] + self.shape_width / 2, shape.center[1] + self.shape_width / 2))
+        if self.trajectory_output and self.trajectory is None:
+            from trajectory import TrajectoryRecorder
+            self.trajectory = TrajectoryRecorder()
+        self.start_layouts()
+        if not self.layouts.size:
+            self.ensure_layout()
+
+    def layout_ready(self):
+        """ True if ensure_layout() will return without waiting for a layout to be generated """
+        return self.index is not None or self.layouts.ready()
+
+    def ensure_layout(self):
+        if self.index is None:
+            self.init_shapes()
+
+    def set_layout(self, layout):
+        self.shapes = layout.shapes
+        self.layout_number += 1
+        self.index = layout.index
+        self.helpers = layout.helpers
+        self.helper = self.helpers[self.technique]
+        self.raster = layout.raster
+
+    def get_layout_params(self):
+        """ The parameters that determine the layouts, see layout_library.generate_layout """
+        return {
+            'screen_width': self.screen_width,
+            'screen_height': self.screen_height,
+            'shape_width': self.shape_width,
+            'distance_between_shapes': self.distance_between_shapes,
+            'num_shapes': self.num_shapes,
+            'num_targets': self.num_targets,
+            'reserved_rects': self.get_reserved_rects(self.screen_width)
+        }
+
+    @classmethod
+    def get_task_hint_geometry(cls, screen_width):
+        """ (x, y, width, height) of the task hint text at the top of the screen """
+        return 5, 5, screen_width - 10, cls.TEXT_AREA_HEIGHT - 5
+
+    @staticmethod
+    def get_progress_bar_geometry(screen_width):
+        """ (x, y, width, height) of the progress bar in the top right corner """
+        return int(screen_width / 2), 5, int(screen_width / 2) - 50, 25
+
+    @classmethod
+    def get_reserved_rects(cls, screen_width):
+        """ The areas of the ui elements as [x, y, width, height], no shapes are placed on them """
+        return [list(cls.get_task_hint_geometry(screen_width)), list(cls.get_progress_bar_geometry(screen_width))]
+
+    def create_layout(self):
+        """
+        Creates the next layout, either the next one of the layout library or a new, random one. This is called from
+        the background thread of the LayoutPrefetcher, so it must not modify the model.
+        """
+        if self.library is not None:
+            layout_shapes = self.library.get(next(self.library_positions) % len(self.library))
+        else:
+            # the layout generation is loaded on first use, so the window can be shown before
+            from layout_library import generate_layout
+            layout_shapes = generate_layout(self.get_layout_params(), self.rng)
+
+        index = SpatialIndex(layout_shapes, self.shape_width)
+        helpers = {
+            TECHNIQUE_GRAVITY: CursorHelper(layout_shapes, self.shape_width, self.helper_gravity_distance),
+            TECHNIQUE_PREDICTION: TargetPredictionHelper(layout_shapes, self.shape_width, self.helper_gravity_distance)
+        }
+        raster = None
+        if self.test_type == TEST_TYPE_AREA:
+            from nearest_raster import NearestShapeRaster
+            raster = NearestShapeRaster(layout_shapes, self.shape_width, self.screen_width, self.screen_height)
+        return Layout(layout_shapes, index, helpers, raster)
 
     def get_next_condition(self):
         self.current_condition_index += 1
@@ -162,24 +341,25 @@ class FittsLawModel:
     def set_helper(self):
         """
         This function can be used to add / remove the helper depending on Condition.
-        Only enabled for test type "full", e.g. an experiment that includes tests with both enabled and disabled helper
-        for the same participant
+        Only enabled for test types "full", "prediction" and "area", e.g. an experiment that includes tests with both
+        enabled and disabled helper for the same participant. The pointing technique is chosen by the condition as well,
+        test type "single" uses the technique from the config file. The area cursor does not move the cursor, so the
+        helper is disabled in the area conditions
         """
         if self.test_type == TEST_TYPE_SINGLE:
-            return
-
-        if Condition(self.current_condition) == Condition.CircleHelper \
-                or Condition(self.current_condition) == Condition.SquareHelper:
-            self.helper_enabled = True
+            self.technique = self.helper_technique
 
         else:
-            self.helper_enabled = False
+            condition = Condition(self.current_condition)
+            self.helper_enabled = condition in HELPER_CONDITIONS or condition in PREDICTION_CONDITIONS
+            self.technique = TECHNIQUE_PREDICTION if condition in PREDICTION_CONDITIONS else TECHNIQUE_GRAVITY
+            self.area_cursor = condition in AREA_CONDITIONS
+
+        if self.helpers:
+            self.helper = self.helpers[self.technique]
 
     def refresh(self):
-        """ Refreshes the displayed shapes, by clearing the arrays and initializing new, random shapes """
-        self.shape_coords.clear()
-        self.target_coords.clear()
-        self.shapes.clear()
+        """ Refreshes the displayed shapes by switching to the next prepared layout """
         self.init_shapes()
 
     def refresh_participant(self):
@@ -194,74 +374,117 @@ class FittsLawModel:
     def handle_click(self, x, y):
         """
         Checks if a mouse click hit a valid target.
-        Returns True on hit.
+        Returns True on hit. The clicked shape (target or distractor) is stored in last_click.
+        With the area cursor, a click anywhere selects the nearest shape.
         """
-        for coord in self.target_coords:
-            if Condition(self.current_condition) == Condition.Circle or \
-                    Condition(self.current_condition) == Condition.CircleHelper:
-                distance = math.sqrt((x - coord[0]) ** 2 + (y - coord[1]) ** 2)
-
-                if distance <= self.shape_width / 2:
-                    return True
-
-            elif Condition(self.current_condition) == Condition.Square or \
-                    Condition(self.current_condition) == Condition.SquareHelper:
-                # we adjusted the target coordinates to be at the center of the shape
-                # in case of the 'square' target we need to adjust these values back to the top-left corner
-                rect_x = coord[0] - self.shape_width / 2
-                rect_y = coord[1] - self.shape_width / 2
-
-                if rect_x < x < rect_x + self.shape_width:
-                    if rect_y < y < rect_y + self.shape_width:
-                        return True
+        if self.area_cursor:
+            shape_index = self.get_nearest_shape(x, y)
+            self.last_click = self.index.get_shape(shape_index) if shape_index is not None else None
+        else:
+            self.last_click = self.index.hit_test(x, y, Condition(self.current_condition) in CIRCLE_CONDITIONS)
+        return self.last_click is not None and self.last_click.is_target
 
-        return False
+    def get_nearest_shape(self, x, y):
+        """ Returns the index of the shape nearest to (x, y) in the layout raster, or None without a raster """
+        return self.raster.lookup(x, y) if self.raster is not None else None
 
-    def start_timer(self):
+    def start_timer(self, timestamp_ns=None):
+        """ :param timestamp_ns: clock_ns() of the mouse event that started the movement, defaults to now """
         if not self.mouse_moving:
             self.mouse_moving = True
-            self.timer.start()
+            self.movement_start_ns = timestamp_ns if timestamp_ns is not None else clock_ns()
 
-    def stop_timer(self):
+    def stop_timer(self, timestamp_ns=None):
+        """
+        :param timestamp_ns: clock_ns() of the click that ended the movement, defaults to now
+        :return: the movement time in ms (with microsecond resolution), or None if the cursor was never moved
+        """
+        self.click_ns = timestamp_ns if timestamp_ns is not None else clock_ns()
+        self.click_time = datetime.now()
         if self.mouse_moving:
             self.mouse_moving = False
-            return self.timer.elapsed()
+            return round((self.click_ns - self.movement_start_ns) / 1e6, 3)
+
+    def record_helper_latency(self, latency_ns):
+        """ Records the time between the arrival of a mouse event and the cursor correction of the helper """
+        self.helper_latency_count += 1
+        self.helper_latency_sum_ns += latency_ns
+        self.helper_latency_max_ns = max(self.helper_latency_max_ns, latency_ns)
 
     def add_log_row(self, click_counter, time_taken, mouse_press_event):
-        self.df = self.df.append({
+        helper_latency_mean_us = None
+        helper_latency_max_us = None
+        if self.helper_latency_count:
+            helper_latency_mean_us = round(self.helper_latency_sum_ns / self.helper_latency_count / 1000, 1)
+            helper_latency_max_us = round(self.helper_latency_max_ns / 1000, 1)
+
+        # the center of the hit target, the reference of the endpoint spread in the analysis
+        target = (None, None)
+        if self.last_click is not None and self.last_click.is_target:
+            target = (round(self.last_click.center[0], 1), round(self.last_click.center[1], 1))
+        row = {
             'user_id': self.user_id,
-            'timestamp': datetime.now(),
+            'timestamp': self.click_time or datetime.now(),
             'condition': Condition(self.current_condition).name,
             'num_clicks': click_counter,
             'time_taken_in_ms': time_taken,
             'click_x': mouse_press_event.x(),
             'click_y': mouse_press_event.y(),
+            'target_x': target[0],
+            'target_y': target[1],
             'target_width': self.shape_width,
 
-            # num_shapes has a slight variance due to shape spreading and shapes being culled from the ui area
-            # this should however not be very noticeable
-            'num_shapes': len(self.shape_coords),
+            # the number of shapes actually on screen, at most numberShapes clamped to the capacity of the screen
+            'num_shapes': len(self.shapes),
             'screen_width': self.screen_width,
             'screen_height': self.screen_height,
-            'helper_enabled': self.helper_enabled
-        }, ignore_index=True)
-
-    def print_log_to_stdout(self):
-        self.df.to_csv(sys.stdout, index=False)
-
-    def remove_shapes_from_text_area(self):
-        """
-        The upper area is reserved only for the ui text, no shapes should be drawn there
-        Removes all elements that have a y-coordinate < 50 from the list of shape coordinates
-        """
-        for shape in self.shape_coords[:]:
-            if shape[1] <= 50:
-                self.shape_coords.remove(shape)
+            'helper_enabled': self.helper_enabled,
+            'movement_start_ns': self.movement_start_ns,
+            'click_ns': self.click_ns,
+            'log_ns': clock_ns(),
+            'helper_latency_mean_us': helper_latency_mean_us,
+            'helper_latency_max_us': helper_latency_max_us
+        }
+        self.log_writer.write_row(row)
+        if time_taken is not None and self.last_click is not None:
+            start = (int(self.screen_width / 2), int(self.screen_height / 2))
+            self.live_stats.add_trial(row['condition'], time_taken, start, self.last_click.center,
+                                      (row['click_x'], row['click_y']), self.shape_width, click_counter)
+
+        if self.trajectory is not None:
+            self.trajectory.end_trial(self.log_writer.rows_written - 1)
+
+        self.movement_start_ns = None
+        self.click_ns = None
+        self.click_time = None
+        self.helper_latency_count = 0
+        self.helper_latency_sum_ns = 0
+        self.helper_latency_max_ns = 0
+
+    def record_trajectory_sample(self, timestamp_ns, x, y, helper_applied):
+        if self.trajectory is not None:
+            self.trajectory.add_sample(timestamp_ns, x, y, helper_applied)
+
+    def close_log(self):
+        """ Writes the remaining rows of the streamed CSV output, the live statistics and the recorded trajectories """
+        self.log_writer.close()
+        self.live_stats.close()
+        if self.trajectory is not None:
+            self.trajectory.save(self.trajectory_output)
+
+    def print_layout_stats_to_stderr(self):
+        print('layout prefetching:', json.dumps(self.layouts.stats()), file=sys.stderr)
 
 
 class FittsLawExperiment(QtWidgets.QWidget):
     DEFAULT_STYLE = "background-color: gray"
-    painter = Qt.QPainter()
+    BACKGROUND_COLOR = "gray"                      # same color as DEFAULT_STYLE, used for the pre-rendered scene
+    READY_POLL_INTERVAL_MS = 10                    # how often to check whether the first layout has been prepared
+    HIGHLIGHT_MARGIN = 4                           # distance between a shape and its highlight in the area conditions
+    painter = QtGui.QPainter()
+
+    # emitted once the first layout is ready, i.e. the experiment can start without delay
+    ready = QtCore.pyqtSignal()
 
     def __init__(self, model):
         super().__init__()
@@ -269,18 +492,41 @@ class FittsLawExperiment(QtWidgets.QWidget):
         self.model = model
         self.circles_drawn = False
         self.start_pos = (int(self.model.screen_width / 2), int(self.model.screen_height / 2))
-        self.progress_bar = Qt.QProgressBar(self)
+        self.progress_bar = QtWidgets.QProgressBar(self)
+        self.shape_pen = QtGui.QPen(QtCore.Qt.black, 2, QtCore.Qt.SolidLine)
+        self.target_brush = QtGui.QBrush(QtCore.Qt.red, QtCore.Qt.SolidPattern)
+        self.shape_brush = QtGui.QBrush(QtCore.Qt.gray)
+        self.highlight_pen = QtGui.QPen(QtCore.Qt.yellow, 3, QtCore.Qt.SolidLine)
+        self.highlighted_shape = None               # the shape the area cursor would select, see set_highlighted_shape
+        self.scene = None                           # pre-rendered task hint and shapes of the current layout
+        self.scene_key = None                       # layout, condition and size the scene was rendered for
+        self.helper_pipeline = HelperPipeline(self, self.model, self.model.helper_rate_hz,
+                                              self.model.helper_tick_budget_ms)
+        self.recorder = None
+        if self.model.session_recording:
+            self.recorder = SessionRecorder(self.model.session_recording, self.model.settings)
+        self.warm_up_started = False
+        self.ready_timer = QtCore.QTimer(self)
+        self.ready_timer.setInterval(self.READY_POLL_INTERVAL_MS)
+        self.ready_timer.timeout.connect(self.check_ready)
+        # flushes the CSV output once the flush interval has passed, even if no further trial is logged
+        self.log_flush_timer = QtCore.QTimer(self)
+        self.log_flush_timer.setSingleShot(True)
+        self.log_flush_timer.timeout.connect(self.flush_log)
         self.init_ui()
         self.current_click_counter = 0
         self.current_repetition = 1
         self.setCursor(QtCore.Qt.ArrowCursor)
+        if self.model.profile_output:
+            profiler.enable(self.model.profile_output)
+        self.helper_pipeline.start()
 
     def init_ui(self):
         self.setFocusPolicy(QtCore.Qt.StrongFocus)
         self.setStyleSheet(self.DEFAULT_STYLE)
         self.resize(self.model.screen_width, self.model.screen_height)
         self.setMouseTracking(True)
-        progress_bar_area = Qt.QRect(self.model.screen_width / 2, 5, self.model.screen_width / 2 - 50, 25)
+        progress_bar_area = QtCore.QRect(*self.model.get_progress_bar_geometry(self.model.screen_width))
         self.progress_bar.setGeometry(progress_bar_area)
         self.progress_bar.setMaximum(self.model.max_repetitions * len(self.model.latin_square))
         self.progress_bar.setValue(0)
@@ -288,63 +534,141 @@ class FittsLawExperiment(QtWidgets.QWidget):
         self.progress_bar.setFormat('Progress: %v of %m (%p %)')
         self.show()
 
+    @profiled('paintEvent')
     def paintEvent(self, event):
         painter = QtGui.QPainter(self)
 
         if self.application_state == ApplicationState.EXPLANATION:
             painter.setPen(QtCore.Qt.black)
-            painter.setFont(Qt.QFont('Decorative', 36))
+            painter.setFont(QtGui.QFont('Decorative', 36))
             painter.drawText(event.rect(), QtCore.Qt.AlignCenter,
                              "Get ready to move your mouse\nand click the red shape!\n\n\n"
                              "Left Click when you are ready to start!")
+            if not self.warm_up_started:
+                # the window is on screen: prepare the experiment while the participant reads the explanation
+                self.warm_up_started = True
+                QtCore.QTimer.singleShot(0, self.warm_up)
             return
 
         if self.application_state == ApplicationState.FINISHED:
             painter.setPen(QtCore.Qt.black)
-            painter.setFont(Qt.QFont('Decorative', 36))
+            painter.setFont(QtGui.QFont('Decorative', 36))
             painter.drawText(event.rect(), QtCore.Qt.AlignCenter,
                              "The experiment is finished!\nThank you for participating\n\n\n"
                              "Click anywhere in the window to\ncontinue with the next participant.")
             return
 
+        # only the dirty part of the pre-rendered scene is copied to the screen
+        if self.scene_key != self.get_scene_key():
+            self.render_scene()
+        dirty_rect = QtCore.QRectF(event.rect())
+        pixel_ratio = self.scene.devicePixelRatio()
+        painter.drawPixmap(dirty_rect, self.scene, QtCore.QRectF(dirty_rect.topLeft() * pixel_ratio,
+                                                                 dirty_rect.size() * pixel_ratio))
+        if self.highlighted_shape is not None:
+            self.draw_highlight(painter)
+
+    def warm_up(self):
+        self.model.warm_up()
+        self.check_ready()
+        if not self.model.layout_ready():
+            self.ready_timer.start()
+
+    def check_ready(self):
+        if self.model.layout_ready():
+            self.ready_timer.stop()
+            self.model.ensure_layout()
+            self.ready.emit()
+
+    def get_scene_key(self):
+        return self.model.layout_number, self.model.current_condition, self.width(), self.height()
+
+    def render_scene(self):
+        """
+        Renders the task hint and all shapes of the current layout into a pixmap once, so that paint events only need
+        to copy the pixmap instead of drawing every shape again
+        """
+        pixel_ratio = self.devicePixelRatioF()
+        self.scene = QtGui.QPixmap(self.size() * pixel_ratio)
+        self.scene.setDevicePixelRatio(pixel_ratio)
+        self.scene.fill(QtGui.QColor(self.BACKGROUND_COLOR))
+
+        painter = QtGui.QPainter(self.scene)
         self.draw_task_hint(painter)
         self.draw_shapes(painter)
+        painter.end()
+        self.scene_key = self.get_scene_key()
 
     def draw_shapes(self, painter):
-        painter.setPen(Qt.QPen(QtCore.Qt.black, 2, QtCore.Qt.SolidLine))
-        for shape in self.model.shapes:
-            if shape.is_target:  # targets should be filled with a red color
-                painter.setBrush(Qt.QBrush(QtCore.Qt.red, QtCore.Qt.SolidPattern))
-            else:
-                painter.setBrush(Qt.QBrush(QtCore.Qt.gray))
+        painter.setPen(self.shape_pen)
+        width = int(self.model.shape_width)
+        shapes = self.model.shapes
 
-            # draw different shapes based on condition
-            if Condition(self.model.current_condition) == Condition.Circle or \
-                    Condition(self.model.current_condition) == Condition.CircleHelper:
-                painter.drawEllipse(int(shape.x_coord), int(shape.y_coord),
-                                    int(self.model.shape_width), int(self.model.shape_width))
+        # draw different shapes based on condition
+        if Condition(self.model.current_condition) in CIRCLE_CONDITIONS:
+            draw_shape = painter.drawEllipse
+        else:
+            draw_shape = painter.drawRect
+
+        # the shapes never overlap, so all distractors can be drawn first and then all targets (filled with red)
+        for is_target, brush in ((False, self.shape_brush), (True, self.target_brush)):
+            group = shapes[shapes['is_target'] == is_target]
+            painter.setBrush(brush)
+            for x, y in zip(group['x'].astype(int).tolist(), group['y'].astype(int).tolist()):
+                draw_shape(x, y, width, width)
+
+    def get_highlight_rect(self, shape_index):
+        shape = self.model.shapes[shape_index]
+        width = int(self.model.shape_width) + 2 * self.HIGHLIGHT_MARGIN
+        return QtCore.QRect(int(shape['x']) - self.HIGHLIGHT_MARGIN, int(shape['y']) - self.HIGHLIGHT_MARGIN,
+                            width, width)
+
+    def draw_highlight(self, painter):
+        painter.setPen(self.highlight_pen)
+        painter.setBrush(QtCore.Qt.NoBrush)
+        rect = self.get_highlight_rect(self.highlighted_shape)
+        if Condition(self.model.current_condition) in CIRCLE_CONDITIONS:
+            painter.drawEllipse(rect)
+        else:
+            painter.drawRect(rect)
 
-            elif Condition(self.model.current_condition) == Condition.Square or \
-                    Condition(self.model.current_condition) == Condition.SquareHelper:
-                painter.drawRect(int(shape.x_coord), int(shape.y_coord),
-                                 int(self.model.shape_width), int(self.model.shape_width))
+    def set_highlighted_shape(self, shape_index):
+        """ Highlights the given shape (None = no shape) and repaints only the areas of the old and new highlight """
+        if shape_index == self.highlighted_shape:
+            return
+        pen_margin = self.highlight_pen.width()
+        for highlighted in (self.highlighted_shape, shape_index):
+            if highlighted is not None:
+                self.update(self.get_highlight_rect(highlighted).adjusted(-pen_margin, -pen_margin,
+                                                                          pen_margin, pen_margin))
+        self.highlighted_shape = shape_index
 
     def draw_task_hint(self, painter):
         painter.setPen(QtCore.Qt.black)
-        painter.setFont(Qt.QFont('Decorative', 24))
-        textarea = QtCore.QRect(5, 5, self.model.screen_width, 50)
+        painter.setFont(QtGui.QFont('Decorative', 24))
+        textarea = QtCore.QRect(*self.model.get_task_hint_geometry(self.model.screen_width))
         painter.drawText(textarea, QtCore.Qt.AlignLeft,
                          "Click on the red shape!")
 
     def keyPressEvent(self, ev):
+        if self.recorder is not None:
+            self.recorder.record_key(ev, clock_ns())
         if ev.key() == QtCore.Qt.Key_H and ev.modifiers() & QtCore.Qt.ControlModifier:
             self.model.helper_enabled = not self.model.helper_enabled
 
+    @profiled('mousePressEvent')
     def mousePressEvent(self, ev):
+        event_ns = clock_ns()
+        if self.recorder is not None:
+            self.recorder.record_mouse(PRESS, ev, event_ns)
         if self.application_state == ApplicationState.EXPLANATION:
             self.application_state = ApplicationState.EXPERIMENT
             self.progress_bar.setVisible(True)
+            # the participant may have been faster than the warm-up
+            self.model.warm_up()
+            self.model.ensure_layout()
             QtGui.QCursor.setPos(self.mapToGlobal(QtCore.QPoint(self.start_pos[0], self.start_pos[1])))
+            self.render_scene()
             self.repaint()
             return
 
@@ -357,13 +681,18 @@ class FittsLawExperiment(QtWidgets.QWidget):
             self.current_click_counter += 1
             hit = self.model.handle_click(ev.x(), ev.y())
             if hit:
-                self.handle_hit(ev)
+                self.handle_hit(ev, event_ns)
 
-    def handle_hit(self, mouse_press_event):
+    @profiled('handle_hit')
+    def handle_hit(self, mouse_press_event, event_ns=None):
+        # stop the timer and log the trial before switching the layout, so neither is affected by the refresh
+        time_taken = self.model.stop_timer(event_ns)
+        self.model.add_log_row(self.current_click_counter, time_taken, mouse_press_event)
+        self.schedule_log_flush()
         self.model.refresh()
+        self.helper_pipeline.reset()
+        self.highlighted_shape = None
         QtGui.QCursor.setPos(self.mapToGlobal(QtCore.QPoint(self.start_pos[0], self.start_pos[1])))
-        time_taken = self.model.stop_timer()
-        self.model.add_log_row(self.current_click_counter, time_taken, mouse_press_event)
         self.current_click_counter = 0
         self.current_repetition += 1
         self.progress_bar.setValue(self.progress_bar.value() + 1)
@@ -379,37 +708,67 @@ class FittsLawExperiment(QtWidgets.QWidget):
                 self.current_repetition = 1
                 self.model.get_next_condition()
 
+        # the layout (and maybe the condition) changed: render the new scene once, then show it
+        if self.application_state == ApplicationState.EXPERIMENT:
+            self.render_scene()
         self.repaint()
 
+    def schedule_log_flush(self):
+        delay = self.model.log_writer.get_flush_delay()
+        if delay is not None and not self.log_flush_timer.isActive():
+            self.log_flush_timer.start(int(delay * 1000) + 1)
+
+    def flush_log(self):
+        self.model.log_writer.flush_if_due()
+        self.schedule_log_flush()
+
     def reset_experiment(self):
         self.current_repetition = 1
         self.model.refresh_participant()
         self.progress_bar.setValue(0)
 
+    @profiled('mouseMoveEvent')
     def mouseMoveEvent(self, ev):
+        event_ns = clock_ns()
+        if profiler.enabled:
+            profiler.record_move_event(ev.timestamp())
         if self.application_state == ApplicationState.EXPLANATION or \
                 self.application_state == ApplicationState.FINISHED:
             return
 
+        # apart from the highlight of the area cursor, moving the cursor does not change anything that is drawn
         if (abs(ev.x() - self.start_pos[0]) > 5) or (abs(ev.y() - self.start_pos[1]) > 5):
-            self.model.start_timer()
-            self.update()
-
-        if self.model.helper_enabled:
-            new_coords = self.model.helper.filter(ev)
+            self.model.start_timer(event_ns)
+        if self.model.area_cursor:
+            self.set_highlighted_shape(self.model.get_nearest_shape(ev.x(), ev.y()))
 
-            if new_coords is not None:
-                QtGui.QCursor.setPos(self.mapToGlobal(self.model.helper.filter(ev)))
+        # the helper pipeline corrects the cursor on its next tick. Moves caused by a correction are recorded as samples
+        # where the helper was applied
+        self_generated = self.helper_pipeline.push(ev, event_ns)
+        self.model.record_trajectory_sample(event_ns, ev.x(), ev.y(), self_generated)
+        if self.recorder is not None:
+            self.recorder.record_mouse(MOVE, ev, event_ns, self_generated)
 
     def closeEvent(self, event):
-        # print the logged data to stdout before closing
-        self.model.print_log_to_stdout()
+        # the rows have already been streamed while the experiment was running, only the rest needs to be written
+        self.helper_pipeline.stop()
+        self.log_flush_timer.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.model.layouts.stop()
+        self.model.close_log()
+        self.model.print_layout_stats_to_stderr()
+        print('helper pipeline:', json.dumps(self.helper_pipeline.stats()), file=sys.stderr)
+        if profiler.enabled:
+            profiler.dump({'layout_prefetching': self.model.layouts.stats(),
+                           'helper_pipeline': self.helper_pipeline.stats()})
         event.accept()
 
 
 def main():
     app = QtWidgets.QApplication(sys.argv)
-    model = FittsLawModel()
+    # the first layout is prepared while the explanation is shown
+    model = FittsLawModel(load_layout=False)
     experiment = FittsLawExperiment(model)
     sys.exit(app.exec_())
 
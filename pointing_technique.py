@@ -5,6 +5,30 @@ from PyQt5 import QtCore
 DistanceToTarget = collections.namedtuple('DistanceToTarget', ['target', 'distance_x', 'distance_y', 'total_distance'])
 
 
+class PointerEvent:
+    """
+    Minimal stand-in for a QMouseEvent, so the pointing techniques and the model can be fed with synthetic pointer
+    positions (e.g. by the headless simulation)
+    """
+
+    def __init__(self, x_coord, y_coord, timestamp_ms=0):
+        self.x_coord = x_coord
+        self.y_coord = y_coord
+        self.timestamp_ms = timestamp_ms
+
+    def x(self):
+        return self.x_coord
+
+    def y(self):
+        return self.y_coord
+
+    def pos(self):
+        return QtCore.QPoint(int(self.x_coord), int(self.y_coord))
+
+    def timestamp(self):
+        return self.timestamp_ms
+
+
 class CursorHelper:
     """
     Helps the user click the target by modifying the position of the mouse cursor.
@@ -15,7 +39,8 @@ class CursorHelper:
     Once on the target, the cursor can only be moved away again by intentional quick movements. This further prevents
     accidentally "overshooting" the target location.
 
-    :param target_coords: A list of tuples containing the x and y coordinates of valid targets
+    :param shapes: The shapes of the layout, a structured array with the top-left corners (x, y) and is_target of
+    every shape (see layout_library.LAYOUT_DTYPE)
     :param shape_width: The width of the shapes on screen. This is used as a part of the distance calculation between
     cursor and target center
     :param gravity_distance: when the distance between cursor and target is below this value, the magnetic pull effect
@@ -24,20 +49,28 @@ class CursorHelper:
 
     # factor by which the magnetic pull should be smoothed. Higher number = smoother and slower cursor adjustment
     MAGNETIC_PULL_SMOOTHING = 10
+    # up to this many targets are scanned in a plain loop, the NumPy call overhead would dominate such small arrays
+    SCALAR_SCAN_MAX_TARGETS = 32
 
-    def __init__(self, target_coords, shape_width, gravity_distance):
+    def __init__(self, shapes, shape_width, gravity_distance):
         super().__init__()
-        self.target_coords = target_coords
+        targets = shapes[shapes['is_target']]
+        self.target_x = targets['x'].astype(float) + shape_width / 2
+        self.target_y = targets['y'].astype(float) + shape_width / 2
+        self.target_centers = list(zip(self.target_x.tolist(), self.target_y.tolist()))
         self.shape_width = shape_width
         self.gravity_distance = gravity_distance
 
     def filter(self, mouse_event):
         distance_to_target = self.get_nearest_target_distance(mouse_event)
 
+        if distance_to_target is None:
+            return None
+
         if distance_to_target.total_distance < self.shape_width / 2 + self.gravity_distance:
-            return (QtCore.QPoint(mouse_event.pos().x()
-                    + (distance_to_target.distance_x / self.MAGNETIC_PULL_SMOOTHING), mouse_event.pos().y()
-                    + (distance_to_target.distance_y / self.MAGNETIC_PULL_SMOOTHING)))
+            return (QtCore.QPoint(int(mouse_event.pos().x()
+                    + (distance_to_target.distance_x / self.MAGNETIC_PULL_SMOOTHING)), int(mouse_event.pos().y()
+                    + (distance_to_target.distance_y / self.MAGNETIC_PULL_SMOOTHING))))
 
         else:
             return None
@@ -47,18 +80,143 @@ class CursorHelper:
         Gets the distance to the nearest valid target. Is designed to support multiple targets, and returns
         the distance to the nearest one.
         """
-        nearest_target = None
-        nearest_target_distance = 0
-        for coord in self.target_coords:
-            distance = math.hypot(ev.x() - coord[0], ev.y() - coord[1])
+        return self.get_nearest_target(ev.x(), ev.y())
 
+    def get_nearest_target(self, x, y):
+        """ Returns the DistanceToTarget of the target nearest to the point (x, y), or None if there are no targets """
+        if len(self.target_centers) <= self.SCALAR_SCAN_MAX_TARGETS:
+            nearest_target = None
+            nearest_distance = math.inf
+            for center in self.target_centers:
+                distance = math.hypot(center[0] - x, center[1] - y)
+                if distance < nearest_distance:
+                    nearest_target = center
+                    nearest_distance = distance
             if nearest_target is None:
-                nearest_target = coord
-                nearest_target_distance = distance
-            else:
-                if distance < nearest_target_distance:
-                    nearest_target = coord
-                    nearest_target_distance = distance
-
-        return DistanceToTarget(nearest_target, nearest_target[0] - ev.x(), nearest_target[1] - ev.y(),
-                                nearest_target_distance)
+                return None
+            return DistanceToTarget(nearest_target, nearest_target[0] - x, nearest_target[1] - y, nearest_distance)
+
+        squared_distances = (self.target_x - x) ** 2 + (self.target_y - y) ** 2
+        i = int(squared_distances.argmin())
+        nearest_target = (float(self.target_x[i]), float(self.target_y[i]))
+        return DistanceToTarget(nearest_target, nearest_target[0] - x, nearest_target[1] - y,
+                                math.sqrt(squared_distances[i]))
+
+
+class TargetPredictionHelper(CursorHelper):
+    """
+    Predicts the target of the current movement before the cursor gets there and pulls the cursor towards it early.
+    The helper keeps the last WINDOW_SIZE pointer samples in a fixed-size ring buffer. The velocity of the movement is
+    the difference between the newest and the oldest sample of the window, so every event takes constant time no
+    matter how large the window is, and no memory is allocated while the pointer moves.
+    The cursor position is extrapolated PREDICTION_HORIZON_MS into the future. If the target nearest to the
+    extrapolated position is close enough to it, and the same target was predicted for STABLE_PREDICTIONS events in a
+    row, the cursor is pulled towards that target. The pull is limited to MAX_PULL_SPEED, so the cursor glides
+    towards the target instead of jumping. Once the cursor is within the gravity distance of a target, the helper
+    behaves like the magnetic CursorHelper.
+    The samples are stored without the corrections of the helper (i.e. the movement of the hand), so the pull does not
+    feed back into the velocity estimate.
+
+    Takes the same parameters as CursorHelper. The mouse events must have a timestamp() in ms, like QMouseEvent.
+    """
+
+    WINDOW_SIZE = 8                                 # number of samples the velocity is estimated from
+    PREDICTION_HORIZON_MS = 150                     # how far into the future the cursor position is extrapolated
+    STABLE_PREDICTIONS = 3                          # number of events the predicted target must stay the same
+    MIN_SPEED = 0.2                                 # in px/ms, slower movements are not extrapolated
+    MAX_PULL_SPEED = 0.5                            # in px/ms, maximum speed of the pull towards a predicted target
+    RESET_GAP_MS = 100                              # a pause longer than this starts a new movement
+
+    def __init__(self, shapes, shape_width, gravity_distance):
+        super().__init__(shapes, shape_width, gravity_distance)
+        self.xs = [0.0] * self.WINDOW_SIZE
+        self.ys = [0.0] * self.WINDOW_SIZE
+        self.timestamps = [0] * self.WINDOW_SIZE
+        self.count = 0                              # number of samples since the start of the movement
+        self.offset_x = 0.0                         # sum of the corrections of the helper since the movement started
+        self.offset_y = 0.0
+        self.predicted_target = None
+        self.stable_predictions = 0
+
+    def filter(self, mouse_event):
+        x = mouse_event.x()
+        y = mouse_event.y()
+        timestamp = mouse_event.timestamp()
+        previous_timestamp = self.timestamps[(self.count - 1) % self.WINDOW_SIZE]
+        if self.count and not 0 <= timestamp - previous_timestamp <= self.RESET_GAP_MS:
+            self.reset()
+        self.add_sample(x - self.offset_x, y - self.offset_y, timestamp)
+
+        distance_to_target = self.get_nearest_target(x, y)
+        if distance_to_target is None:
+            return None
+
+        capture_distance = self.shape_width / 2 + self.gravity_distance
+        if distance_to_target.total_distance < capture_distance:
+            return self.move_cursor(x, y, distance_to_target.distance_x / self.MAGNETIC_PULL_SMOOTHING,
+                                    distance_to_target.distance_y / self.MAGNETIC_PULL_SMOOTHING)
+
+        predicted_target = self.predict_target(x, y, capture_distance)
+        if predicted_target is None:
+            return None
+
+        # pull towards the predicted target, at most MAX_PULL_SPEED times the time since the last event
+        distance_x = predicted_target[0] - x
+        distance_y = predicted_target[1] - y
+        distance = math.hypot(distance_x, distance_y)
+        step = min(distance / self.MAGNETIC_PULL_SMOOTHING, self.MAX_PULL_SPEED * (timestamp - previous_timestamp))
+        if step < 1:
+            return None
+        return self.move_cursor(x, y, distance_x * step / distance, distance_y * step / distance)
+
+    def reset(self):
+        self.count = 0
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.predicted_target = None
+        self.stable_predictions = 0
+
+    def add_sample(self, x, y, timestamp):
+        i = self.count % self.WINDOW_SIZE
+        self.xs[i] = x
+        self.ys[i] = y
+        self.timestamps[i] = timestamp
+        self.count += 1
+
+    def get_velocity(self):
+        """ Returns the velocity of the hand in px/ms over the window, or None if it cannot be estimated """
+        if self.count < 2:
+            return None
+        newest = (self.count - 1) % self.WINDOW_SIZE
+        oldest = (self.count - min(self.count, self.WINDOW_SIZE)) % self.WINDOW_SIZE
+        duration = self.timestamps[newest] - self.timestamps[oldest]
+        if duration <= 0:
+            return None
+        return (self.xs[newest] - self.xs[oldest]) / duration, (self.ys[newest] - self.ys[oldest]) / duration
+
+    def predict_target(self, x, y, capture_distance):
+        """ Returns the center of the predicted target if the prediction is stable, otherwise None """
+        velocity = self.get_velocity()
+        if velocity is None or math.hypot(velocity[0], velocity[1]) < self.MIN_SPEED:
+            self.predicted_target = None
+            self.stable_predictions = 0
+            return None
+
+        predicted = self.get_nearest_target(x + velocity[0] * self.PREDICTION_HORIZON_MS,
+                                            y + velocity[1] * self.PREDICTION_HORIZON_MS)
+        if predicted is None or predicted.total_distance >= capture_distance:
+            self.predicted_target = None
+            self.stable_predictions = 0
+            return None
+
+        if predicted.target == self.predicted_target:
+            self.stable_predictions += 1
+        else:
+            self.predicted_target = predicted.target
+            self.stable_predictions = 1
+        return self.predicted_target if self.stable_predictions >= self.STABLE_PREDICTIONS else None
+
+    def move_cursor(self, x, y, dx, dy):
+        self.offset_x += int(x + dx) - x
+        self.offset_y += int(y + dy) - y
+        return QtCore.QPoint(int(x + dx), int(y + dy))
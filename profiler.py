@@ -0,0 +1,150 @@
+"""
+Opt-in profiling of the Qt event handlers.
+
+Handlers decorated with @profiled record their latency into a histogram with logarithmic buckets, so recording is O(1)
+and the memory does not grow with the length of the session. At the end of the session the latency percentiles
+(p50/p95/p99), the event rates and gaps in the stream of mouse move events (moves that were coalesced or dropped before
+they reached the widget) are dumped as JSON.
+
+Profiling is enabled with the 'profileOutput' setting in config.json or the environment variable POINTING_PROFILE
+(both set the path of the JSON file). When it is disabled, a decorated handler only checks one flag.
+"""
+import functools
+import json
+import math
+import os
+import time
+
+ENVIRONMENT_VARIABLE = 'POINTING_PROFILE'
+
+
+class LatencyHistogram:
+    """ Histogram of durations with logarithmic buckets from 100 ns to 100 s """
+
+    BUCKETS_PER_DECADE = 20
+    MIN_EXPONENT = 2                                # 10^2 ns
+    NUM_BUCKETS = 9 * BUCKETS_PER_DECADE            # up to 10^11 ns
+
+    def __init__(self):
+        self.counts = [0] * (self.NUM_BUCKETS + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        bucket = int((math.log10(max(duration_ns, 1)) - self.MIN_EXPONENT) * self.BUCKETS_PER_DECADE)
+        self.counts[min(max(bucket, 0), self.NUM_BUCKETS)] += 1
+
+    def percentile(self, percent):
+        """ Returns the upper bound (in ns) of the bucket that contains the given percentile """
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(10 ** (self.MIN_EXPONENT + (bucket + 1) / self.BUCKETS_PER_DECADE), self.max_ns)
+        return self.max_ns
+
+    def to_dict(self):
+        def to_us(ns):
+            return None if ns is None else round(ns / 1000, 2)
+
+        return {
+            'count': self.count,
+            'mean_us': to_us(self.total_ns / self.count) if self.count else None,
+            'p50_us': to_us(self.percentile(50)),
+            'p95_us': to_us(self.percentile(95)),
+            'p99_us': to_us(self.percentile(99)),
+            'max_us': to_us(self.max_ns)
+        }
+
+
+class HandlerProfiler:
+    # a gap between two move events that is longer than this means that moves were coalesced or dropped ...
+    MOVE_GAP_THRESHOLD_MS = 20
+    # ... unless it is that long that the pointer was simply not moving
+    MOVE_IDLE_THRESHOLD_MS = 500
+
+    def __init__(self):
+        self.enabled = False
+        self.output = ''
+        self.start_ns = 0
+        self.handlers = {}
+        self.move_intervals = LatencyHistogram()
+        self.last_move_timestamp = None
+        self.move_gaps = 0
+
+    def enable(self, output):
+        self.enabled = True
+        self.output = output
+        self.start_ns = time.perf_counter_ns()
+
+    def record(self, name, duration_ns):
+        histogram = self.handlers.get(name)
+        if histogram is None:
+            histogram = self.handlers[name] = LatencyHistogram()
+        histogram.record(duration_ns)
+
+    def record_move_event(self, timestamp_ms):
+        """ :param timestamp_ms: the timestamp of the QMouseEvent, assigned by the windowing system """
+        if self.last_move_timestamp is not None:
+            interval = timestamp_ms - self.last_move_timestamp
+            # synthetic events (e.g. from a test driver) can have timestamps that run backwards
+            if 0 <= interval < self.MOVE_IDLE_THRESHOLD_MS:
+                self.move_intervals.record(interval * 1000000)
+                if interval > self.MOVE_GAP_THRESHOLD_MS:
+                    self.move_gaps += 1
+        self.last_move_timestamp = timestamp_ms
+
+    def report(self, extra=None):
+        duration = (time.perf_counter_ns() - self.start_ns) / 1e9
+        handlers = {}
+        for name, histogram in sorted(self.handlers.items()):
+            handlers[name] = histogram.to_dict()
+            handlers[name]['events_per_second'] = round(histogram.count / duration, 2) if duration else None
+
+        report = {
+            'session_seconds': round(duration, 3),
+            'handlers': handlers,
+            'mouse_move_intervals': self.move_intervals.to_dict(),
+            'mouse_move_gaps': self.move_gaps
+        }
+        report.update(extra or {})
+        return report
+
+    def dump(self, extra=None):
+        with open(self.output, 'w') as file:
+            json.dump(self.report(extra), file, indent=2)
+
+
+profiler = HandlerProfiler()
+
+
+def profiled(name):
+    """ Decorator that records the latency of a handler while profiling is enabled """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(name, time.perf_counter_ns() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def get_profile_output(configured_output):
+    """ The environment variable takes precedence over the config file """
+    return os.environ.get(ENVIRONMENT_VARIABLE) or configured_output
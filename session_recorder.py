@@ -0,0 +1,175 @@
+"""
+Records the input events of a session and replays them.
+
+The recorder writes the raw event stream of FittsLawExperiment (mouse moves, mouse presses and key presses) to a JSON
+lines file: the first line holds the settings of the experiment, including the seed of the layouts, every further line
+one event. Moves that were caused by the pointing helper are marked, since a replay creates them again.
+
+The replay driver creates the experiment from the recorded settings under the offscreen Qt platform and sends the
+events to the widget again, either as fast as possible or in real time. In fast mode the helper pipeline is ticked
+according to the recorded clock instead of its timer, so the replay does not depend on the speed of the machine.
+The time every event takes to process is reported as latency percentiles per event type and as a list of all events,
+so a performance regression can be bisected with a real session.
+
+Usage: python session_recorder.py <session.jsonl> [--real-time] [--output timings.json] [--log replay.csv]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from profiler import LatencyHistogram
+
+MOVE = 'move'
+PRESS = 'press'
+KEY = 'key'
+
+
+class SessionRecorder:
+    """
+    :param path: the JSON lines file the session is written to
+    :param settings: the settings of the experiment (the 'experiment' part of the config), so the session can be
+    replayed with the same layouts and conditions
+    """
+
+    def __init__(self, path, settings):
+        self.file = open(path, 'w')
+        self.start_ns = time.perf_counter_ns()
+        self.file.write(json.dumps({'settings': settings}) + '\n')
+
+    def record_mouse(self, event_type, mouse_event, event_ns, self_generated=False):
+        """ :param event_ns: clock_ns() at the arrival of the event """
+        self.file.write(json.dumps([event_ns - self.start_ns, event_type, mouse_event.x(), mouse_event.y(),
+                                    int(mouse_event.button()), mouse_event.timestamp(), self_generated]) + '\n')
+
+    def record_key(self, key_event, event_ns):
+        self.file.write(json.dumps([event_ns - self.start_ns, KEY, key_event.key(), int(key_event.modifiers()),
+                                    key_event.timestamp()]) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+def load_session(path):
+    """ Returns the recorded settings and the list of events """
+    with open(path) as file:
+        settings = json.loads(file.readline())['settings']
+        events = [json.loads(line) for line in file if line.strip()]
+    return settings, events
+
+
+def create_event(event):
+    """ Creates the QEvent for a recorded event """
+    from PyQt5 import QtCore, QtGui
+
+    if event[1] == KEY:
+        _, _, key, modifiers, timestamp = event
+        qt_event = QtGui.QKeyEvent(QtCore.QEvent.KeyPress, key, QtCore.Qt.KeyboardModifiers(modifiers))
+    else:
+        _, event_type, x, y, button, timestamp, _ = event
+        if event_type == PRESS:
+            qt_event = QtGui.QMouseEvent(QtCore.QEvent.MouseButtonPress, QtCore.QPointF(x, y),
+                                         QtCore.Qt.MouseButton(button), QtCore.Qt.MouseButtons(button),
+                                         QtCore.Qt.NoModifier)
+        else:
+            qt_event = QtGui.QMouseEvent(QtCore.QEvent.MouseMove, QtCore.QPointF(x, y), QtCore.Qt.NoButton,
+                                         QtCore.Qt.NoButton, QtCore.Qt.NoModifier)
+    qt_event.setTimestamp(timestamp)
+    return qt_event
+
+
+def replay(path, real_time=False, log_output=os.devnull):
+    """
+    Replays a recorded session offscreen.
+    :param real_time: if True, the events are sent with their recorded timing, otherwise as fast as possible
+    :param log_output: where the CSV log of the replayed session is written to
+    :return: dictionary with the latency percentiles per event type and the duration of every event in us
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtWidgets
+    from pointing_experiment import FittsLawExperiment, FittsLawModel
+
+    settings, events = load_session(path)
+    settings.update({'logOutput': log_output, 'trajectoryOutput': '', 'sessionRecording': '', 'profileOutput': '',
+                     'liveStatsOutput': ''})
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as config_file:
+        json.dump({'experiment': settings}, config_file)
+    try:
+        model = FittsLawModel(config_file.name)
+    finally:
+        os.remove(config_file.name)
+    experiment = FittsLawExperiment(model)
+    pipeline = experiment.helper_pipeline
+    tick_interval_ns = pipeline.interval_ms * 1000000
+    if not real_time:
+        pipeline.stop()
+    app.processEvents()
+
+    histograms = {}
+    durations = []
+    next_tick_ns = 0
+    replay_start_ns = time.perf_counter_ns()
+    for event in events:
+        # moves caused by the helper are created again by the replayed helper
+        if event[1] != KEY and event[-1]:
+            continue
+
+        if real_time:
+            while time.perf_counter_ns() - replay_start_ns < event[0]:
+                app.processEvents()
+                time.sleep(0.0005)
+        else:
+            # tick the helper pipeline on the recorded clock. Without a pending move there is nothing to tick until
+            # this event arrives
+            if pipeline.pending is None:
+                next_tick_ns = -(-event[0] // tick_interval_ns) * tick_interval_ns
+            while next_tick_ns <= event[0]:
+                pipeline.tick()
+                next_tick_ns += tick_interval_ns
+
+        qt_event = create_event(event)
+        start = time.perf_counter_ns()
+        QtWidgets.QApplication.sendEvent(experiment, qt_event)
+        app.processEvents()
+        duration = time.perf_counter_ns() - start
+
+        histograms.setdefault(event[1], LatencyHistogram()).record(duration)
+        durations.append([event[0], event[1], round(duration / 1000, 1)])
+
+    total_seconds = (time.perf_counter_ns() - replay_start_ns) / 1e9
+    experiment.close()
+    return {
+        'session': os.path.abspath(path),
+        'real_time': real_time,
+        'events': len(durations),
+        'recorded_seconds': events[-1][0] / 1e9 if events else 0.0,
+        'replay_seconds': round(total_seconds, 3),
+        'trials': model.log_writer.rows_written,
+        'latency': {event_type: histogram.to_dict() for event_type, histogram in sorted(histograms.items())},
+        'helper_pipeline': pipeline.stats(),
+        'event_durations_us': durations
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded session of the pointing experiment offscreen')
+    parser.add_argument('session', help='the recorded session (.jsonl)')
+    parser.add_argument('--real-time', action='store_true', help='replay with the recorded timing')
+    parser.add_argument('--output', default='', help='JSON file for the timings of all events')
+    parser.add_argument('--log', default=os.devnull, help='CSV log of the replayed session')
+    args = parser.parse_args()
+
+    report = replay(args.session, args.real_time, args.log)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+    del report['event_durations_us']
+    print(json.dumps(report, indent=1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+Headless simulation of the pointing experiment.
+
+Runs the experiment without a window: the FittsLawModel (layouts, hit testing, condition schedule and logging) and the
+pointing helper are driven by a synthetic pointer instead of a participant. The synthetic pointer plans its movements
+with Fitts' law and moves along minimum-jerk paths with noisy endpoints. Movement times and endpoints of a whole batch
+of trials are drawn at once, so thousands of trials can be used to stress test layout generation, hit testing and the
+helper. The output is a CSV file in the same format as a real session.
+
+Usage: python simulation.py <config.json> [--trials N] [--output sim.csv] [--seed S] [--trials-per-layout N]
+                            [--helper-paths]
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from layout_library import get_target_centers
+from pointing_experiment import FittsLawModel
+from pointing_technique import PointerEvent
+
+# a normal distribution of endpoints with a standard deviation of W / 4.133 has an effective width of W
+EFFECTIVE_WIDTH_FACTOR = 4.133
+
+
+class MinimumJerkPointer:
+    """
+    Synthetic participant. The movement time follows Fitts' law MT = a + b * log2(D / W + 1) with log-normal noise, the
+    endpoints are normally distributed around the target center and the path between start and endpoint follows a
+    minimum-jerk velocity profile.
+
+    :param intercept: Fitts' law intercept a in ms
+    :param slope: Fitts' law slope b in ms/bit
+    :param time_noise: standard deviation of the log-normal noise of the movement time
+    :param endpoint_spread: standard deviation of the endpoints per axis, in units of W / 4.133 (1.0 means the
+    effective width equals the target width)
+    :param sample_rate: sampling rate of the paths in Hz
+    :param rng: a numpy.random.Generator
+    """
+
+    def __init__(self, intercept=150, slope=150, time_noise=0.1, endpoint_spread=1.0, sample_rate=1000, rng=None):
+        self.intercept = intercept
+        self.slope = slope
+        self.time_noise = time_noise
+        self.endpoint_spread = endpoint_spread
+        self.sample_rate = sample_rate
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def plan(self, starts, targets, width):
+        """
+        Plans the movements of a batch of trials.
+        :param starts: (N, 2) array of start positions
+        :param targets: (N, 2) array of target centers
+        :param width: the width of the targets
+        :return: an (N,) array of movement times in ms and an (N, 2) array of endpoints
+        """
+        distances = np.hypot(targets[:, 0] - starts[:, 0], targets[:, 1] - starts[:, 1])
+        movement_times = self.get_movement_times(distances, width)
+        endpoints = targets + self.rng.normal(0, width / EFFECTIVE_WIDTH_FACTOR * self.endpoint_spread, targets.shape)
+        return movement_times, endpoints
+
+    def get_movement_times(self, distances, width):
+        index_of_difficulty = np.log2(distances / width + 1)
+        noise = self.rng.lognormal(0, self.time_noise, np.shape(distances))
+        return (self.intercept + self.slope * index_of_difficulty) * noise
+
+    def path(self, start, end, movement_time):
+        """ Returns the (n, 2) positions of a minimum-jerk movement from start to end, sampled at sample_rate """
+        num_samples = max(int(movement_time * self.sample_rate / 1000), 2)
+        tau = np.linspace(0, 1, num_samples)
+        progress = tau ** 3 * (10 - 15 * tau + 6 * tau ** 2)
+        return np.asarray(start) + progress[:, None] * (np.asarray(end) - np.asarray(start))
+
+
+class Simulation:
+    """
+    Runs simulated trials through a FittsLawModel, following the same condition schedule as FittsLawExperiment.
+
+    :param model: the FittsLawModel
+    :param pointer: the synthetic pointer, e.g. a MinimumJerkPointer
+    :param trials_per_layout: number of trials that are run on the same layout (with a random target each time)
+    :param helper_paths: if True, every movement path is fed through the pointing helper sample by sample when the
+    helper is enabled (slow, but tests the helper behaviour). Otherwise the helper is ignored
+    """
+
+    def __init__(self, model, pointer, trials_per_layout=1, helper_paths=False):
+        self.model = model
+        self.pointer = pointer
+        self.trials_per_layout = trials_per_layout
+        self.helper_paths = helper_paths
+        self.rng = pointer.rng
+        self.start_pos = np.array([int(model.screen_width / 2), int(model.screen_height / 2)])
+        self.current_repetition = 1
+        self.layout = None
+        self.target_centers = None
+        self.trials_on_layout = 0
+        self.trials = 0
+        self.misses = 0
+        self.helper_corrections = 0
+
+    def run(self, num_trials, batch_size=1000):
+        while self.trials < num_trials:
+            self.run_batch(min(batch_size, num_trials - self.trials))
+
+    def run_batch(self, num_trials):
+        # pick the layouts and targets first, then plan all movements of the batch at once
+        layouts = []
+        targets = np.empty((num_trials, 2))
+        for i in range(num_trials):
+            if self.layout is None or self.trials_on_layout >= self.trials_per_layout:
+                self.layout = self.model.layouts.get()
+                self.target_centers = get_target_centers(self.layout.shapes, self.model.shape_width)
+                self.trials_on_layout = 0
+            self.trials_on_layout += 1
+            layouts.append(self.layout)
+            targets[i] = self.target_centers[self.rng.integers(len(self.target_centers))]
+
+        starts = np.tile(self.start_pos, (num_trials, 1))
+        movement_times, endpoints = self.pointer.plan(starts, targets, self.model.shape_width)
+
+        for i in range(num_trials):
+            self.model.set_layout(layouts[i])
+            self.run_trial(starts[i], targets[i], movement_times[i], endpoints[i])
+
+    def run_trial(self, start, target, movement_time, endpoint):
+        if self.helper_paths and self.model.helper_enabled:
+            endpoint = self.apply_helper(start, endpoint, movement_time)
+
+        clicks = 1
+        time_taken = movement_time
+        while not self.model.handle_click(endpoint[0], endpoint[1]):
+            # missed: a corrective movement from the current position to the target
+            self.misses += 1
+            clicks += 1
+            correction_time, corrected = self.pointer.plan(endpoint[None, :], target[None, :], self.model.shape_width)
+            time_taken += correction_time[0]
+            endpoint = corrected[0]
+
+        self.model.add_log_row(clicks, int(round(time_taken)), PointerEvent(int(endpoint[0]), int(endpoint[1])))
+        self.trials += 1
+        self.next_trial()
+
+    def apply_helper(self, start, endpoint, movement_time):
+        """
+        Moves the cursor along the path of the hand. Whenever the helper sets a new cursor position, the offset between
+        hand and cursor changes, just like QCursor.setPos does for a real mouse.
+        :return: the position of the cursor at the end of the movement
+        """
+        offset = np.zeros(2)
+        for i, position in enumerate(self.pointer.path(start, endpoint, movement_time)):
+            cursor = position + offset
+            timestamp_ms = i * 1000 // self.pointer.sample_rate
+            new_coords = self.model.helper.filter(PointerEvent(cursor[0], cursor[1], timestamp_ms))
+            if new_coords is not None:
+                self.helper_corrections += 1
+                offset += (new_coords.x() - cursor[0], new_coords.y() - cursor[1])
+
+        return endpoint + offset
+
+    def next_trial(self):
+        """ Same schedule as FittsLawExperiment.handle_hit: next repetition, next condition or next participant """
+        self.current_repetition += 1
+        if self.current_repetition > self.model.max_repetitions:
+            self.current_repetition = 1
+            if self.model.current_participant_repetitions >= len(self.model.latin_square):
+                self.model.refresh_participant()
+            else:
+                self.model.current_participant_repetitions += 1
+                self.model.get_next_condition()
+
+    def stats(self):
+        return {
+            'trials': self.trials,
+            'misses': self.misses,
+            'helper_corrections': self.helper_corrections,
+            'layouts': self.model.layouts.stats()
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the pointing experiment with a synthetic participant')
+    parser.add_argument('config', help='the config file of the experiment')
+    parser.add_argument('--trials', type=int, default=1000, help='number of simulated trials')
+    parser.add_argument('--output', default='stdout', help="CSV output file (must not exist yet), or 'stdout'")
+    parser.add_argument('--seed', type=int, default=None, help='seed of the synthetic pointer')
+    parser.add_argument('--trials-per-layout', type=int, default=1, help='number of trials on the same layout')
+    parser.add_argument('--helper-paths', action='store_true', help='feed every path through the pointing helper')
+    parser.add_argument('--batch-size', type=int, default=1000, help='number of trials planned at once')
+    args = parser.parse_args()
+
+    model = FittsLawModel(args.config, {'logOutput': args.output, 'logFlushRows': args.batch_size,
+                                        'trajectoryOutput': ''})
+    simulation = Simulation(model, MinimumJerkPointer(rng=np.random.default_rng(args.seed)),
+                            args.trials_per_layout, args.helper_paths)
+
+    start = time.perf_counter()
+    simulation.run(args.trials, args.batch_size)
+    duration = time.perf_counter() - start
+    model.layouts.stop()
+    model.close_log()
+
+    stats = simulation.stats()
+    stats['seconds'] = duration
+    stats['trials_per_second'] = simulation.trials / duration if duration else 0.0
+    print(json.dumps(stats), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
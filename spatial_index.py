@@ -0,0 +1,65 @@
+"""
+Spatial index over the shapes of a single layout.
+
+The shapes are sorted into a uniform grid with a cell size of one shape width, so a click can only hit shapes whose
+center lies in the 3x3 block of cells around it. The grid is built once per layout; afterwards hit tests take (expected)
+constant time. The nearest target is found by the pointing techniques themselves, see CursorHelper.get_nearest_target.
+"""
+import collections
+
+HitResult = collections.namedtuple('HitResult', ['shape_index', 'is_target', 'center'])
+
+
+class SpatialIndex:
+    """
+    :param shapes: The shapes of the layout, a structured array with the top-left corners (x, y) and is_target of
+    every shape (see layout_library.LAYOUT_DTYPE)
+    :param shape_width: The width of the shapes on screen
+    """
+
+    def __init__(self, shapes, shape_width):
+        self.shape_width = shape_width
+        # the queries look at single shapes, which is faster with python numbers than with numpy scalars
+        self.centers = list(zip((shapes['x'].astype(float) + shape_width / 2).tolist(),
+                                (shapes['y'].astype(float) + shape_width / 2).tolist()))
+        self.is_target = shapes['is_target'].tolist()
+
+        self.cell_size = max(shape_width, 1)
+        self.cells = collections.defaultdict(list)
+        for i, center in enumerate(self.centers):
+            self.cells[self.get_cell(center, self.cell_size)].append(i)
+
+    @staticmethod
+    def get_cell(pt, cell_size):
+        return int(pt[0] // cell_size), int(pt[1] // cell_size)
+
+    def get_shape(self, i):
+        """ Returns shape i as a HitResult """
+        return HitResult(i, self.is_target[i], self.centers[i])
+
+    def hit_test(self, x, y, circle):
+        """
+        Returns the shape that contains the point (x, y) as a HitResult, or None if no shape was hit.
+        If the shapes overlap (distanceBetweenShapes < shapeWidth) and the point is inside several of them, a target is
+        preferred, since the targets are drawn on top of the other shapes.
+        :param circle: True if the shapes are drawn as circles, False if they are drawn as squares
+        """
+        half_width = self.shape_width / 2
+        cell_x, cell_y = self.get_cell((x, y), self.cell_size)
+        distractor = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in self.cells.get((cell_x + dx, cell_y + dy), ()):
+                    center = self.centers[i]
+                    if circle:
+                        hit = (x - center[0]) ** 2 + (y - center[1]) ** 2 <= half_width ** 2
+                    else:
+                        hit = abs(x - center[0]) < half_width and abs(y - center[1]) < half_width
+
+                    if hit:
+                        if self.is_target[i]:
+                            return HitResult(i, True, center)
+                        if distractor is None:
+                            distractor = HitResult(i, False, center)
+
+        return distractor
@@ -0,0 +1,73 @@
+"""
+Records the pointer trajectory of every trial.
+
+The samples of the current trial go into a preallocated ring buffer (one NumPy array per field), so recording a mouse
+move event only writes four numbers and never allocates memory. At the end of a trial the samples are copied in one
+block into the session store, which grows by doubling. The session can be saved as a single .npy file of a structured
+array, where every sample is keyed by the index of its trial (the row of the trial in the CSV log).
+"""
+import numpy as np
+
+TRAJECTORY_DTYPE = np.dtype([('trial', np.int32), ('timestamp_ns', np.int64), ('x', np.int32), ('y', np.int32),
+                             ('helper_applied', np.bool_)])
+
+
+class TrajectoryRecorder:
+    """
+    :param trial_capacity: number of samples the ring buffer of a single trial can hold. If a trial has more samples,
+    only the most recent ones are kept and the rest is counted in dropped_samples. The default holds more than a minute
+    of movement at a polling rate of 1000 Hz
+    """
+
+    DEFAULT_TRIAL_CAPACITY = 65536
+    INITIAL_SESSION_CAPACITY = 65536
+
+    def __init__(self, trial_capacity=DEFAULT_TRIAL_CAPACITY):
+        self.capacity = trial_capacity
+        self.timestamps = np.zeros(trial_capacity, dtype=np.int64)
+        self.xs = np.zeros(trial_capacity, dtype=np.int32)
+        self.ys = np.zeros(trial_capacity, dtype=np.int32)
+        self.helper_applied = np.zeros(trial_capacity, dtype=np.bool_)
+        self.count = 0                              # number of samples recorded in the current trial
+        self.dropped_samples = 0                    # samples that were overwritten because a trial was too long
+
+        self.session = np.zeros(self.INITIAL_SESSION_CAPACITY, dtype=TRAJECTORY_DTYPE)
+        self.session_size = 0
+
+    def add_sample(self, timestamp_ns, x, y, helper_applied):
+        i = self.count % self.capacity
+        self.timestamps[i] = timestamp_ns
+        self.xs[i] = x
+        self.ys[i] = y
+        self.helper_applied[i] = helper_applied
+        self.count += 1
+
+    def end_trial(self, trial):
+        """ Moves the samples of the current trial into the session store and empties the ring buffer """
+        n = min(self.count, self.capacity)
+        self.dropped_samples += self.count - n
+        # the oldest sample is at the write position if the ring buffer has wrapped around
+        order = np.roll(np.arange(n), -(self.count % self.capacity)) if self.count > self.capacity else slice(0, n)
+
+        if self.session_size + n > len(self.session):
+            grown = np.zeros(max(2 * len(self.session), self.session_size + n), dtype=TRAJECTORY_DTYPE)
+            grown[:self.session_size] = self.session[:self.session_size]
+            self.session = grown
+
+        samples = self.session[self.session_size:self.session_size + n]
+        samples['trial'] = trial
+        samples['timestamp_ns'] = self.timestamps[order]
+        samples['x'] = self.xs[order]
+        samples['y'] = self.ys[order]
+        samples['helper_applied'] = self.helper_applied[order]
+        self.session_size += n
+        self.count = 0
+
+    def discard_trial(self):
+        self.count = 0
+
+    def get_samples(self):
+        return self.session[:self.session_size]
+
+    def save(self, path):
+        np.save(path, self.get_samples())